@@ -1,20 +1,26 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from routes import auth
 from routes import chat, records
 from database import engine
 from models import user, record
 from dotenv import load_dotenv
+import logging
 import os
 
 # Load environment variables
 load_dotenv()
 
+# Module loggers (e.g. the request classifier) honour LOG_LEVEL; DEBUG detail is off by default
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+
 # Create database tables
 user.Base.metadata.create_all(bind=engine)
 record.Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+# Route responses are serialized with orjson rather than the stdlib encoder
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -7,6 +7,20 @@ import os
 
 security = HTTPBearer()
 
+# Upper bound on bearer token size; legitimate tokens are a few hundred bytes
+MAX_TOKEN_LEN = 8192
+
+# Only the claims our tokens actually carry are checked (see create_access_token)
+_JWT_OPTIONS = {
+    "verify_signature": True,
+    "verify_exp": True,
+    "verify_nbf": False,
+    "verify_iat": False,
+    "verify_aud": False,
+    "verify_iss": False,
+    "require": ["sub", "exp"],
+}
+
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
     """
     Verifies the JWT token and returns the user data
@@ -19,12 +33,27 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
             detail="No token, authorization denied"
         )
     
+    if len(token) > MAX_TOKEN_LEN:
+        raise HTTPException(
+            status_code=401,
+            detail="Token too large"
+        )
+    
+    # A JWS compact token is always header.payload.signature; reject anything
+    # else before paying for base64/JSON decoding inside jwt.decode
+    if token.count(".") != 2:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid token format"
+        )
+    
     try:
         # Verify token using your JWT secret
         payload = jwt.decode(
             token, 
             os.environ.get("SECRET_KEY"), 
-            algorithms=["HS256"]
+            algorithms=["HS256"],
+            options=_JWT_OPTIONS
         )
         user_id = payload.get("sub")
         
@@ -1,12 +1,16 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from database import Base
 
 class Record(Base):
     __tablename__ = "records"
+    # Covers both "records for user X" and "latest records for user X" lookups
+    __table_args__ = (Index("ix_records_user_created", "user_id", "created_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    data = Column(JSON, nullable=False)
+    # Binary JSONB on Postgres (no re-parse per read); plain JSON on the SQLite fallback
+    data = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False)
     file_name = Column(String)
-    created_at = Column(DateTime(timezone=True), server_default=func.now()) 
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True) 
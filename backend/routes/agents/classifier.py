@@ -1,28 +1,245 @@
 # classifier/request_classifier.py
 from typing import Dict, Any, List, Optional
-from openai import OpenAI
+from openai import AsyncOpenAI
 import os
 import json
-from fastapi import HTTPException, Depends
-import pandas as pd
-from together import Together
+import logging
+import re
+from collections import OrderedDict
+from functools import lru_cache
+import httpx
+from fastapi import HTTPException
+from together import AsyncTogether
+
+logger = logging.getLogger(__name__)
+
+# Categories the router in routes/chat.py knows how to dispatch
+_CATEGORIES = ("visualization", "transformation", "statistical", "query")
+
+def _quoted_choices(values) -> str:
+    """Render values as "'a', 'b', or 'c'" for the prompt."""
+    quoted = [f"'{value}'" for value in values]
+    return quoted[0] if len(quoted) == 1 else ", ".join(quoted[:-1]) + f", or {quoted[-1]}"
+
+# Response field holding the operation sub-type for each intent
+_SUBTYPE_KEYS = {
+    "visualization": "visualization_type",
+    "transformation": "transformation_type",
+    "statistical": "statistical_type",
+    "query": "query_type",
+}
+
+# Example responses shown to the model, serialized once at import
+_CLASSIFICATION_EXAMPLES = [
+    ("Visualization example", {
+        "intent": "visualization",
+        "reason": "User is asking for a visual representation of the data with a specific chart type",
+        "visualization_type": "bar",
+        "transformation_type": None,
+        "statistical_type": None,
+        "query_type": None
+    }),
+    ("Transformation example", {
+        "intent": "transformation",
+        "reason": "User is asking for data to be filtered based on specific criteria",
+        "visualization_type": None,
+        "transformation_type": "filter",
+        "statistical_type": None,
+        "query_type": None
+    }),
+    ("Statistical example", {
+        "intent": "statistical",
+        "reason": "User is asking for a correlation analysis between two variables",
+        "visualization_type": None,
+        "transformation_type": None,
+        "statistical_type": "correlation",
+        "query_type": None
+    }),
+    ("Query example (ONLY for questions requiring NO analysis)", {
+        "intent": "query",
+        "reason": "User is asking about the structure of the dataset without requiring any analysis",
+        "visualization_type": None,
+        "transformation_type": None,
+        "statistical_type": None,
+        "query_type": "informational"
+    }),
+]
+
+# Static instructions and examples come first so that every request shares
+# an identical prefix the provider can cache; only the user prompt varies.
+_CLASSIFICATION_PROMPT_PREFIX = """
+Analyze the prompt given at the end and determine if it's requesting data transformation, visualization, statistical analysis, or simply asking a question about the data.
+
+IMPORTANT: The "query" category should ONLY be used when the request requires NO analysis, transformation, or visualization whatsoever.
+If the request involves ANY data processing, calculations, summarization, or insights, it should be classified as one of the other categories.
+
+For statistical analysis,
+User's query requires ANY kind of interpretation of data, statistical tests, or analysis. 
+Even simple requests for summaries, averages, counts, or insights count as statistical analysis.
+Possible keywords related to statistical analysis are:
+- "analyze", "statistical", "statistics", "test", "hypothesis", "significance", "p-value"
+- "calculate", "compute", "find the average/mean/median/mode", "summarize", "total"
+- "best", "worst", "highest", "lowest", "max", "min", "top", "bottom"
+- "how many", "count", "sum", "percentage", "proportion", "rate"
+- Specific analysis types like "correlation", "regression", "t-test", "chi-square", "ANOVA"
+- Statistical concepts like "distribution", "normality", "variance", "standard deviation"
+- "find relationships", "compare groups", "determine if significant"
+- Time series analysis, "trend analysis", "seasonality", "forecasting"
+- Comparative analysis, "compare", "contrast", "differences between groups"
+- Exploratory data analysis, "explore", "discover patterns", "identify anomalies"
+- ANY request asking for insights or conclusions from the data
+
+For transformation:
+User asks for data manipulation or transformation without visualization.
+Possible keywords related to transformation are:
+- Filtering (e.g., "filter", "where", "only show", "find", "exclude")
+- Sorting (e.g., "sort", "order", "arrange", "rank")
+- Aggregation (e.g., "group", "sum", "average", "count", "total", "by")
+- Column operations (e.g., "create column", "new column", "calculate", "rename", "drop column")
+
+For visualization:
+User asks for visualization of data.
+Possible keywords related to visualization are:
+- "show me a chart/graph", "plot", "visualize", "create a chart", "graph this data"
+- "display", "draw", "illustrate", "visual representation"
+- Specific chart types like "bar chart", "pie chart", "line graph", "scatter plot"
+
+For query (conversational questions):
+ONLY use this category when the request:
+- Requires absolutely NO analysis or calculation
+- Can be answered with direct lookup or simple description of what's in the data
+- Examples of true queries: "What columns are in this dataset?", "How many rows are there?", "What's this dataset about?"
+- If the user asks for ANY insights, calculations, or information derived from the data, it should be statistical analysis instead
+
+Provide a JSON response with:
+1. intent: Either """ + _quoted_choices(_CATEGORIES) + """
+2. reason: Brief explanation of why this classification was chosen
+3. visualization_type: If intent is 'visualization', specify the chart type ('bar', 'line', 'pie', 'scatter', 'area')
+4. transformation_type: If intent is 'transformation', specify the operation type ('filter', 'sort', 'aggregate', 'column_op')
+5. statistical_type: If intent is 'statistical', specify the test type ('correlation', 'ttest', 'chi_square', 'anova', 'regression', 'distribution', 'descriptive', 'summary')
+6. query_type: If intent is 'query', specify the question type ('informational', 'comparative', 'exploratory')
+
+Example response format for each category:
+
+""" + "\n\n".join(
+    f"{i}. {label}:\n{json.dumps(example, indent=2)}"
+    for i, (label, example) in enumerate(_CLASSIFICATION_EXAMPLES, start=1)
+)
+
+# High-signal phrases that pin a prompt to one category without asking the model.
+# Deliberately narrow: generic words shared across categories ("sum", "count",
+# "show") are left to the LLM.
+_FAST_PATH_PATTERNS = {
+    "visualization": re.compile(
+        r"\b(?:bar|pie|line|scatter|area)\s+(?:chart|graph|plot)s?\b|\b(?:visuali[sz]e|plot|histogram)\b",
+        re.IGNORECASE
+    ),
+    "statistical": re.compile(
+        r"\b(?:correlat\w*|regression|t-?test|anova|chi-?square|p-?value|hypothesis|standard\s+deviation|statistic\w*|analy[sz]e|analysis)\b",
+        re.IGNORECASE
+    ),
+    "transformation": re.compile(
+        r"\b(?:filter|sort\s+(?:by|the)|remove\s+duplicates|rename|drop\s+(?:the\s+)?columns?|(?:add|create)\s+(?:a\s+)?(?:new\s+)?column)\b",
+        re.IGNORECASE
+    ),
+}
+
+def _fast_classify(user_message: str) -> Optional[str]:
+    """Return a category when exactly one category's keywords match, otherwise None."""
+    matches = [category for category, pattern in _FAST_PATH_PATTERNS.items() if pattern.search(user_message)]
+    return matches[0] if len(matches) == 1 else None
+
+_JSON_DECODER = json.JSONDecoder()
+
+# Matches a complete "intent" value in a partially streamed reply
+_INTENT_PATTERN = re.compile(r'"intent"\s*:\s*"([^"]+)"')
+
+async def _close_stream(stream: Any) -> None:
+    """Release the HTTP response behind a possibly half-read completion stream."""
+    # OpenAI's AsyncStream exposes close(); Together returns an async generator
+    close = getattr(stream, "close", None) or getattr(stream, "aclose", None)
+    if close is not None:
+        await close()
+
+# Prompts shorter than this go straight to "query"; longer ones are truncated to the max
+_MIN_PROMPT_CHARS = 3
+_MAX_PROMPT_CHARS = 2000
+
+# Exact-match LRU of normalized user message -> category
+_CLASSIFY_CACHE_SIZE = 10_000
+_classify_cache: "OrderedDict[tuple, str]" = OrderedDict()
+
+def _response_format(categories) -> Dict[str, Any]:
+    """Structured-output schema for OpenAI: the server only emits objects that
+    match it, so intent and sub-types are always one of the listed values."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "request_classification",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "intent": {"type": "string", "enum": list(categories)},
+                    "reason": {"type": "string"},
+                    "visualization_type": {"type": ["string", "null"], "enum": ["bar", "line", "pie", "scatter", "area", None]},
+                    "transformation_type": {"type": ["string", "null"], "enum": ["filter", "sort", "aggregate", "column_op", None]},
+                    "statistical_type": {"type": ["string", "null"], "enum": ["correlation", "ttest", "chi_square", "anova", "regression", "distribution", "descriptive", "summary", None]},
+                    "query_type": {"type": ["string", "null"], "enum": ["informational", "comparative", "exploratory", None]}
+                },
+                "required": ["intent", "reason", "visualization_type", "transformation_type", "statistical_type", "query_type"],
+                "additionalProperties": False
+            }
+        }
+    }
+
+_CLASSIFICATION_RESPONSE_FORMAT = _response_format(_CATEGORIES)
+
+_CLASSIFICATION_SYSTEM_PROMPT = "You are a classification API that prioritizes statistical analysis, transformation, and visualization over query. Only classify as 'query' when the request requires ABSOLUTELY NO analysis or data processing. Return only the JSON response as specified in the example response format. Do not include markdown formatting or code blocks."
+
+@lru_cache(maxsize=None)
+def _get_async_client(provider: str):
+    """Return the process-wide API client for a provider so every classifier shares one connection pool."""
+    if provider == "TOGETHER":
+        return AsyncTogether(api_key=os.getenv("TOGETHER_API_KEY"))
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            timeout=60.0
+        )
+    )
 
 class RequestClassifier:
-    def __init__(self):
+    CATEGORIES = _CATEGORIES
+
+    def __init__(self, categories: Optional[List[str]] = None, prompt_prefix: Optional[str] = None):
+        # Custom categories need a prompt_prefix that describes them; the
+        # default prompt only knows the four built-in ones
+        self.categories = tuple(categories) if categories else self.CATEGORIES
+        self.prompt_prefix = prompt_prefix or _CLASSIFICATION_PROMPT_PREFIX
+        self.default_category = "statistical" if "statistical" in self.categories else self.categories[0]
+        
         if os.getenv("MODEL") == "TOGETHER":
-            print("Using Together API...")
+            logger.info("Using Together API...")
             try:
-                self.client = Together(api_key=os.getenv("TOGETHER_API_KEY"))
-                self.model = "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8"
+                self.client = _get_async_client("TOGETHER")
+                self.model = os.getenv("CLASSIFIER_MODEL", "meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo")
+                # Together supports JSON mode but not OpenAI's json_schema format
+                self.response_format = {"type": "json_object"}
             except Exception as e:
-                print(f"Error loading Together API: {str(e)}")
+                logger.error("Error loading Together API: %s", e)
                 raise HTTPException(status_code=500, detail="Failed to load Together API.")
         else:
             try:
-                self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-                self.model = "gpt-4o"
+                self.client = _get_async_client("OPENAI")
+                self.model = os.getenv("CLASSIFIER_MODEL", "gpt-4o-mini")
+                self.response_format = (
+                    _CLASSIFICATION_RESPONSE_FORMAT if self.categories == _CATEGORIES
+                    else _response_format(self.categories)
+                )
             except Exception as e:
-                print(f"Error loading OpenAI API: {str(e)}")
+                logger.error("Error loading OpenAI API: %s", e)
                 raise HTTPException(status_code=500, detail="Failed to load OpenAI API.")
         
         
@@ -37,164 +254,89 @@ class RequestClassifier:
         - query: ONLY conversational questions that require no data analysis
         """
         # Extract user message
-        user_message = request_data.message
+        user_message = (request_data.message or "").strip()
         
-        # Create classification prompt
-        response_format = {
-            "intent": "query",
-            "reason": "Prompt is asking a question about the data",
-            "visualization_type": None,
-            "transformation_type": None,
-            "statistical_type": None,
-            "query_type": "informational"
-        }
-
-        classification_prompt = f"""
-        Analyze the following prompt and determine if it's requesting data transformation, visualization, statistical analysis, or simply asking a question about the data.
+        # Nothing to classify in an empty or one/two-character prompt
+        if len(user_message) < _MIN_PROMPT_CHARS:
+            return "query" if "query" in self.categories else self.default_category
+        
+        # Bound input tokens for very long pastes; the intent is in the opening text
+        user_message = user_message[:_MAX_PROMPT_CHARS]
+        
+        # Serve repeated questions without another API round-trip
+        # Keyed by category set so classifiers with different categories never share answers
+        cache_key = (self.categories, " ".join(user_message.lower().split()))
+        cached = _classify_cache.get(cache_key)
+        if cached is not None:
+            _classify_cache.move_to_end(cache_key)
+            logger.debug("Classification cache hit: %s", cached)
+            return cached
+        
+        # Unambiguous keyword prompts skip the API call entirely
+        fast_category = _fast_classify(user_message)
+        if fast_category is not None and fast_category in self.categories:
+            logger.debug("Fast-path category: %s", fast_category)
+            return fast_category
         
-        IMPORTANT: The "query" category should ONLY be used when the request requires NO analysis, transformation, or visualization whatsoever.
-        If the request involves ANY data processing, calculations, summarization, or insights, it should be classified as one of the other categories.
-
-        Prompt: {user_message}
-
-        For statistical analysis,
-        User's query requires ANY kind of interpretation of data, statistical tests, or analysis. 
-        Even simple requests for summaries, averages, counts, or insights count as statistical analysis.
-        Possible keywords related to statistical analysis are:
-        - "analyze", "statistical", "statistics", "test", "hypothesis", "significance", "p-value"
-        - "calculate", "compute", "find the average/mean/median/mode", "summarize", "total"
-        - "best", "worst", "highest", "lowest", "max", "min", "top", "bottom"
-        - "how many", "count", "sum", "percentage", "proportion", "rate"
-        - Specific analysis types like "correlation", "regression", "t-test", "chi-square", "ANOVA"
-        - Statistical concepts like "distribution", "normality", "variance", "standard deviation"
-        - "find relationships", "compare groups", "determine if significant"
-        - Time series analysis, "trend analysis", "seasonality", "forecasting"
-        - Comparative analysis, "compare", "contrast", "differences between groups"
-        - Exploratory data analysis, "explore", "discover patterns", "identify anomalies"
-        - ANY request asking for insights or conclusions from the data
-
-        For transformation:
-        User asks for data manipulation or transformation without visualization.
-        Possible keywords related to transformation are:
-        - Filtering (e.g., "filter", "where", "only show", "find", "exclude")
-        - Sorting (e.g., "sort", "order", "arrange", "rank")
-        - Aggregation (e.g., "group", "sum", "average", "count", "total", "by")
-        - Column operations (e.g., "create column", "new column", "calculate", "rename", "drop column")
-
-        For visualization:
-        User asks for visualization of data.
-        Possible keywords related to visualization are:
-        - "show me a chart/graph", "plot", "visualize", "create a chart", "graph this data"
-        - "display", "draw", "illustrate", "visual representation"
-        - Specific chart types like "bar chart", "pie chart", "line graph", "scatter plot"
-
-        For query (conversational questions):
-        ONLY use this category when the request:
-        - Requires absolutely NO analysis or calculation
-        - Can be answered with direct lookup or simple description of what's in the data
-        - Examples of true queries: "What columns are in this dataset?", "How many rows are there?", "What's this dataset about?"
-        - If the user asks for ANY insights, calculations, or information derived from the data, it should be statistical analysis instead
-
-        Provide a JSON response with:
-        1. intent: Either 'visualization', 'transformation', 'statistical', or 'query'
-        2. reason: Brief explanation of why this classification was chosen
-        3. visualization_type: If intent is 'visualization', specify the chart type ('bar', 'line', 'pie', 'scatter', 'area')
-        4. transformation_type: If intent is 'transformation', specify the operation type ('filter', 'sort', 'aggregate', 'column_op')
-        5. statistical_type: If intent is 'statistical', specify the test type ('correlation', 'ttest', 'chi_square', 'anova', 'regression', 'distribution', 'descriptive', 'summary')
-        6. query_type: If intent is 'query', specify the question type ('informational', 'comparative', 'exploratory')
-
-        Example response format for each category:
-
-        1. Visualization example:
-        {json.dumps({
-            "intent": "visualization",
-            "reason": "User is asking for a visual representation of the data with a specific chart type",
-            "visualization_type": "bar",
-            "transformation_type": None,
-            "statistical_type": None,
-            "query_type": None
-        }, indent=2)}
-
-        2. Transformation example:
-        {json.dumps({
-            "intent": "transformation",
-            "reason": "User is asking for data to be filtered based on specific criteria",
-            "visualization_type": None,
-            "transformation_type": "filter",
-            "statistical_type": None,
-            "query_type": None
-        }, indent=2)}
-
-        3. Statistical example:
-        {json.dumps({
-            "intent": "statistical",
-            "reason": "User is asking for a correlation analysis between two variables",
-            "visualization_type": None,
-            "transformation_type": None,
-            "statistical_type": "correlation",
-            "query_type": None
-        }, indent=2)}
-
-        4. Query example (ONLY for questions requiring NO analysis):
-        {json.dumps({
-            "intent": "query",
-            "reason": "User is asking about the structure of the dataset without requiring any analysis",
-            "visualization_type": None,
-            "transformation_type": None,
-            "statistical_type": None,
-            "query_type": "informational"
-        }, indent=2)}"""
+        # Append the user prompt last so the static prefix stays cacheable
+        classification_prompt = f"{self.prompt_prefix}\n\nPrompt: {user_message}"
         
-        # Get classification from OpenAI
-        response = self.client.chat.completions.create(
+        # Get classification from OpenAI, streaming so we can stop reading as
+        # soon as the intent is out; the remaining fields only feed debug logs
+        stream = await self.client.chat.completions.create(
             model=self.model,
             messages=[
-                {"role": "system", "content": "You are a classification API that prioritizes statistical analysis, transformation, and visualization over query. Only classify as 'query' when the request requires ABSOLUTELY NO analysis or data processing. Return only the JSON response as specified in the example response format. Do not include markdown formatting or code blocks."},
+                {"role": "system", "content": _CLASSIFICATION_SYSTEM_PROMPT},
                 {"role": "user", "content": classification_prompt}
             ],
             temperature=0.1,
-            max_tokens=200
+            max_tokens=80,
+            response_format=self.response_format,
+            stream=True
         )
         
+        content = ""
+        intent_match = None
+        try:
+            async for chunk in stream:
+                if chunk.choices:
+                    content += chunk.choices[0].delta.content or ""
+                    intent_match = _INTENT_PATTERN.search(content)
+                    if intent_match:
+                        break
+        finally:
+            await _close_stream(stream)
+        
         # Extract and parse the response
         try:
-            # Clean the response content by removing any markdown formatting
-            content = response.choices[0].message.content.strip()
-            if content.startswith('```json'):
-                content = content[7:]
-            if content.endswith('```'):
-                content = content[:-3]
-            content = content.strip()
+            if intent_match:
+                response_data = {"intent": intent_match.group(1)}
+            else:
+                # Decode the first JSON object in the reply; tolerates any stray
+                # prose or fences a JSON-mode provider still wraps around it
+                response_data, _ = _JSON_DECODER.raw_decode(content, max(content.find("{"), 0))
+            category = response_data.get("intent", self.default_category).lower()
             
-            # Parse the JSON response
-            response_data = json.loads(content)
-            category = response_data.get("intent", "statistical").lower()  # Default to statistical on missing intent
-            
-            print(f"Parsed category: {category}")
+            logger.debug("Parsed category: %s", category)
             
             # Get additional details about the operation type
-            if category == "transformation":
-                transformation_type = response_data.get("transformation_type")
-                print(f"Transformation type: {transformation_type}")
-            elif category == "visualization":
-                visualization_type = response_data.get("visualization_type")
-                print(f"Visualization type: {visualization_type}")
-            elif category == "statistical":
-                statistical_type = response_data.get("statistical_type", "descriptive")
-                print(f"Statistical type: {statistical_type}")
-            elif category == "query":
-                query_type = response_data.get("query_type")
-                print(f"Query type: {query_type}")
+            subtype_key = _SUBTYPE_KEYS.get(category)
+            if subtype_key:
+                logger.debug("%s: %s", subtype_key, response_data.get(subtype_key))
                 
         except (json.JSONDecodeError, AttributeError) as e:
-            print(f"Error parsing OpenAI response: {str(e)}")
-            print(f"Raw response: {response.choices[0].message.content}")
-            category = "statistical"  # Default to statistical on error
+            logger.warning("Error parsing OpenAI response: %s", e)
+            logger.debug("Raw response: %s", content)
+            return self.default_category
         
         # Validate category
-        valid_categories = ["visualization", "transformation", "statistical", "query"]
-        if category not in valid_categories:
-            print(f"Invalid category: {category}. Defaulting to statistical.")
-            category = "statistical"
+        if category not in self.categories:
+            logger.warning("Invalid category: %s. Defaulting to %s.", category, self.default_category)
+            return self.default_category
+        
+        # Only genuine model answers are cached, never the error fallbacks
+        _classify_cache[cache_key] = category
+        if len(_classify_cache) > _CLASSIFY_CACHE_SIZE:
+            _classify_cache.popitem(last=False)
             
-        return category
\ No newline at end of file
+        return category
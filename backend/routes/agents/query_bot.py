@@ -1,19 +1,82 @@
 from typing import Dict, Any, List, Optional
-from openai import OpenAI
+from openai import AsyncOpenAI
 import os
 import json
+import orjson
 from fastapi import HTTPException
 import pandas as pd
 import numpy as np
 import traceback
+import hashlib
+import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from functools import lru_cache
+from routes.agents.sandbox import compile_source, sandbox_globals
 
 import dotenv
 dotenv.load_dotenv()
 
+# Column-name patterns, matched case-insensitively in a single regex scan per name
+_SENSITIVE_COLUMN_PATTERN = re.compile(r"password|secret|token|key|ssn|social", re.IGNORECASE)
+_TIME_COLUMN_PATTERN = re.compile(r"date|time|year|month|day", re.IGNORECASE)
+
+# Row cap for value_counts()/unique() on string columns; longer columns are sampled
+_VALUE_COUNTS_SAMPLE_ROWS = 100_000
+
+# Bounded pool for the pandas-heavy preprocessing so it never runs on the event loop
+_CPU_EXECUTOR = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 2))
+
+# LRU caches of LLM outputs keyed by a (question, column schema) fingerprint, so
+# repeat questions against same-shaped data skip the decision/codegen round-trips
+_LLM_CACHE_SIZE = 1024
+_code_decision_cache: "OrderedDict[str, bool]" = OrderedDict()
+_analysis_code_cache: "OrderedDict[str, str]" = OrderedDict()
+
+# Final answers keyed by a digest of the whole completion request (model, messages, sampling)
+_answer_cache: "OrderedDict[str, str]" = OrderedDict()
+
+def _cache_get(cache: OrderedDict, key: str) -> Any:
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+def _cache_put(cache: OrderedDict, key: str, value: Any) -> None:
+    cache[key] = value
+    if len(cache) > _LLM_CACHE_SIZE:
+        cache.popitem(last=False)
+
+@lru_cache(maxsize=256)
+def _load_analysis_function(src_hash: bytes, src: str):
+    """Define the generated analyze_data once per distinct source and return it (None if missing)."""
+    # One dict for globals and locals, so top-level imports and helpers in the
+    # source are visible from inside analyze_data
+    scope = sandbox_globals(pd=pd, np=np)
+    exec(compile_source(src, "<analyze_data>"), scope)
+    return scope.get("analyze_data")
+
+def _schema_fingerprint(message: str, df: pd.DataFrame) -> str:
+    """Hash the user question together with the DataFrame's column names and dtypes."""
+    schema = ",".join(f"{col}:{dtype}" for col, dtype in df.dtypes.items())
+    return hashlib.sha256(f"{message}|{schema}".encode("utf-8")).hexdigest()
+
 class QueryBot:
     def __init__(self):
         """Initialize the QueryBot with the OpenAI client."""
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    
+    @staticmethod
+    def _blank_cells(df: pd.DataFrame) -> pd.DataFrame:
+        """Boolean frame marking cells that are missing or whitespace-only strings."""
+        blank = df.isna()
+        # Only object columns can hold strings; typed columns need just the isna check
+        object_locs = [loc for loc, dtype in enumerate(df.dtypes) if dtype == object]
+        if object_locs:
+            whitespace = df.iloc[:, object_locs].apply(lambda col: col.astype(str).str.strip().eq(''))
+            blank.iloc[:, object_locs] = blank.iloc[:, object_locs].to_numpy() | whitespace.to_numpy()
+        return blank
     
     def _create_dataframe_from_raw(self, raw_data: List[Any]) -> pd.DataFrame:
         """Convert raw data to a pandas DataFrame and clean it by removing empty rows and columns."""
@@ -26,55 +89,33 @@ class QueryBot:
                 headers = raw_data[0]
                 
                 # Filter out empty header columns
-                valid_headers = []
-                valid_indices = []
-                for i, header in enumerate(headers):
-                    if header is not None and str(header).strip() != '':
-                        valid_headers.append(header)
-                        valid_indices.append(i)
+                valid_indices = [i for i, header in enumerate(headers)
+                                 if header is not None and str(header).strip() != '']
                 
-                # Filter data rows to only include columns with valid headers
-                # AND filter out completely empty rows
-                cleaned_data = []
-                for row in raw_data[1:]:
-                    if len(row) >= len(headers):  # Ensure row has enough elements
-                        # Extract only valid columns
-                        filtered_row = [row[i] for i in valid_indices]
-                        
-                        # Check if row contains any non-empty values
-                        has_data = False
-                        for val in filtered_row:
-                            if val is not None and str(val).strip() != '':
-                                has_data = True
-                                break
-                        
-                        # Only add rows with actual data
-                        if has_data:
-                            cleaned_data.append(filtered_row)
-                    
-                df = pd.DataFrame(cleaned_data, columns=valid_headers)
+                # Build the frame in one go (rows shorter than the header are
+                # dropped, longer ones trimmed) and keep only valid columns. Cells
+                # stay as objects so a blank row's ''/None cannot fix a column's dtype
+                rows = [row[:len(headers)] for row in raw_data[1:] if len(row) >= len(headers)]
+                df = pd.DataFrame(rows, columns=headers, dtype=object).iloc[:, valid_indices]
+                
+                # Filter out completely empty rows in a single vectorized pass,
+                # then infer dtypes from the rows that remain
+                df = df[~self._blank_cells(df).all(axis=1)].infer_objects()
                 print(f"Created DataFrame from array format. Valid columns: {df.columns.tolist()}, Raw rows: {len(raw_data)-1}, Clean rows: {len(df)}")
             else:
-                # If data is in object format
-                # First, create a list of dictionaries, filtering out empty rows
-                filtered_data = []
-                for item in raw_data:
-                    # Check if the item has any non-empty values
-                    has_data = False
-                    for key, val in item.items():
-                        if val is not None and str(val).strip() != '':
-                            has_data = True
-                            break
-                    
-                    if has_data:
-                        filtered_data.append(item)
-                
-                df = pd.DataFrame(filtered_data)
+                # If data is in object format, filter out rows with no non-empty values;
+                # as above, dtypes are inferred only after blank records are gone
+                df = pd.DataFrame(raw_data, dtype=object)
+                df = df[~self._blank_cells(df).all(axis=1)].infer_objects()
                 print(f"Created DataFrame from object format. Columns: {df.columns.tolist()}, Raw rows: {len(raw_data)}, Clean rows: {len(df)}")
             
             # Additional cleaning for any remaining empty values
-            # Convert empty strings to NaN
-            df = df.replace('', pd.NA)
+            # Convert empty strings to NaN, touching only object columns since
+            # numeric/datetime columns cannot hold '' in the first place
+            for loc, dtype in enumerate(df.dtypes):
+                if dtype == object:
+                    col_values = df.iloc[:, loc]
+                    df.isetitem(loc, col_values.mask(col_values.eq(''), pd.NA))
             
             # Final check for any completely empty rows
             df = df.dropna(how='all')
@@ -86,13 +127,12 @@ class QueryBot:
             print(f"Error creating DataFrame: {str(e)}")
             traceback.print_exc()
             return pd.DataFrame()
-        except Exception as e:
-            print(f"Error creating DataFrame: {str(e)}")
-            traceback.print_exc()
-            return pd.DataFrame()
-        except Exception as e:
-            print(f"Error creating DataFrame: {str(e)}")
-            return pd.DataFrame()
+    
+    def _record_column_error(self, summary: dict, df: pd.DataFrame, col: str, col_error: Exception) -> None:
+        """Fall back to a raw sample for a column whose statistics could not be computed."""
+        print(f"Error analyzing column {col}: {str(col_error)}")
+        summary["samples"][col] = df[col].dropna().head(3).astype(str).tolist()
+        summary["column_statistics"][col] = {"type": "error", "error": str(col_error)}
     
     def _get_data_summary(self, df: pd.DataFrame) -> dict:
         """Generate a comprehensive summary of the DataFrame."""
@@ -100,96 +140,122 @@ class QueryBot:
             return {"error": "Empty DataFrame"}
         
         try:
+            # Snapshot dtypes once; everything below dispatches on it
+            dtypes = df.dtypes
+            
             # Basic info
             summary = {
                 "row_count": len(df),
                 "column_count": len(df.columns),
                 "columns": df.columns.tolist(),
-                "data_types": {col: str(dtype) for col, dtype in df.dtypes.items()},
+                "data_types": {col: str(dtype) for col, dtype in dtypes.items()},
                 "samples": {},
                 "column_statistics": {},
                 "potential_insights": []
             }
             
-            # Generate samples and statistics for each column
-            for col in df.columns:
+            # Bucket columns by dtype once so each kind of statistic can be
+            # computed for all of its columns in a single vectorized call
+            string_cols, numeric_cols, bool_cols, datetime_cols, other_cols = [], [], [], [], []
+            for col, dtype in dtypes.items():
+                kind = dtype.kind
                 # Skip if column contains sensitive data (inferred by column name)
-                if any(term in col.lower() for term in ["password", "secret", "token", "key", "ssn", "social"]):
+                if _SENSITIVE_COLUMN_PATTERN.search(col):
                     summary["samples"][col] = ["[REDACTED]"]
-                    continue
-                
-                # Get sample values and statistics
+                elif kind in 'OUS':
+                    string_cols.append(col)
+                elif kind == 'b':
+                    # describe() on a mixed frame silently drops bools, so keep them apart
+                    bool_cols.append(col)
+                elif kind in 'iuf':
+                    numeric_cols.append(col)
+                elif kind == 'M':
+                    datetime_cols.append(col)
+                else:
+                    other_cols.append(col)
+            
+            # One aggregation over all numeric columns; skips describe()'s extra quantile passes
+            numeric_describe = df[numeric_cols].agg(['count', 'mean', 'std', 'min', 'max', 'median']).astype(float).to_dict() if numeric_cols else {}
+            bool_describe = df[bool_cols].describe().to_dict() if bool_cols else {}
+            string_nunique = df[string_cols].nunique().to_dict() if string_cols else {}
+            datetime_min = df[datetime_cols].min().to_dict() if datetime_cols else {}
+            datetime_max = df[datetime_cols].max().to_dict() if datetime_cols else {}
+            
+            # Frequencies on very long columns are estimated from a fixed-size sample
+            sampled = len(df) > _VALUE_COUNTS_SAMPLE_ROWS
+            for col in string_cols:
                 try:
-                    # Handle different data types appropriately
-                    if df[col].dtype == 'object' or pd.api.types.is_string_dtype(df[col]):
-                        # For string columns, get unique values and frequency
-                        unique_vals = df[col].dropna().unique()
-                        samples = unique_vals[:5].tolist() if len(unique_vals) > 0 else []
-                        summary["samples"][col] = samples
-                        
-                        # String column statistics
-                        value_counts = df[col].value_counts(normalize=True).head(3).to_dict()
-                        summary["column_statistics"][col] = {
-                            "type": "categorical",
-                            "unique_count": len(unique_vals),
-                            "most_common": value_counts
-                        }
-                        
-                    elif pd.api.types.is_numeric_dtype(df[col]):
-                        # For numeric columns, get detailed statistics
-                        numeric_stats = df[col].describe().to_dict()
-                        
-                        # Convert numpy types to Python native types for JSON serialization
-                        for k, v in numeric_stats.items():
-                            if isinstance(v, (np.int_, np.float_)):
-                                numeric_stats[k] = float(v)
-                        
-                        # Add samples
-                        samples = df[col].dropna().sample(min(5, len(df[col].dropna()))).tolist()
-                        summary["samples"][col] = samples
-                        
-                        # Store numeric statistics
-                        summary["column_statistics"][col] = {
-                            "type": "numeric",
-                            "statistics": numeric_stats
-                        }
-                        
-                    elif pd.api.types.is_datetime64_any_dtype(df[col]):
-                        # For datetime columns
-                        summary["samples"][col] = df[col].dropna().head(5).astype(str).tolist()
-                        
-                        # Datetime statistics
-                        summary["column_statistics"][col] = {
-                            "type": "datetime",
-                            "min": str(df[col].min()) if not pd.isna(df[col].min()) else None,
-                            "max": str(df[col].max()) if not pd.isna(df[col].max()) else None,
-                            "range_days": (df[col].max() - df[col].min()).days if not pd.isna(df[col].min()) and not pd.isna(df[col].max()) else None
-                        }
-                    else:
-                        # For other column types
-                        summary["samples"][col] = df[col].dropna().head(5).astype(str).tolist()
-                        summary["column_statistics"][col] = {"type": "other"}
-                        
+                    values = df[col].sample(_VALUE_COUNTS_SAMPLE_ROWS, random_state=0) if sampled else df[col]
+                    
+                    # One frequency pass serves both the samples (the five most
+                    # common values) and the top-three shares
+                    frequencies = values.value_counts(normalize=True)
+                    summary["samples"][col] = frequencies.index[:5].tolist()
+                    
+                    # String column statistics
+                    value_counts = frequencies.head(3).to_dict()
+                    summary["column_statistics"][col] = {
+                        "type": "categorical",
+                        "unique_count": int(string_nunique[col]),
+                        "most_common": value_counts
+                    }
+                    if sampled:
+                        summary["column_statistics"][col]["most_common_sample_rows"] = _VALUE_COUNTS_SAMPLE_ROWS
+                except Exception as col_error:
+                    self._record_column_error(summary, df, col, col_error)
+            
+            for col in numeric_cols + bool_cols:
+                try:
+                    # For numeric columns, get detailed statistics
+                    # (already plain floats thanks to the frame-level astype above)
+                    numeric_stats = numeric_describe[col] if col in numeric_describe else bool_describe[col]
+                    
+                    # Add samples (first non-null values, deterministic like the other column kinds)
+                    summary["samples"][col] = df[col].dropna().head(5).tolist()
+                    
+                    # Store numeric statistics
+                    summary["column_statistics"][col] = {
+                        "type": "numeric",
+                        "statistics": numeric_stats
+                    }
+                except Exception as col_error:
+                    self._record_column_error(summary, df, col, col_error)
+            
+            for col in datetime_cols:
+                try:
+                    # For datetime columns
+                    summary["samples"][col] = df[col].dropna().head(5).astype(str).tolist()
+                    
+                    # Datetime statistics
+                    col_min, col_max = datetime_min[col], datetime_max[col]
+                    summary["column_statistics"][col] = {
+                        "type": "datetime",
+                        "min": str(col_min) if not pd.isna(col_min) else None,
+                        "max": str(col_max) if not pd.isna(col_max) else None,
+                        "range_days": (col_max - col_min).days if not pd.isna(col_min) and not pd.isna(col_max) else None
+                    }
                 except Exception as col_error:
-                    print(f"Error analyzing column {col}: {str(col_error)}")
-                    # If error, just get raw sample
-                    summary["samples"][col] = df[col].dropna().head(3).astype(str).tolist()
-                    summary["column_statistics"][col] = {"type": "error", "error": str(col_error)}
+                    self._record_column_error(summary, df, col, col_error)
+            
+            for col in other_cols:
+                # For other column types
+                summary["samples"][col] = df[col].dropna().head(5).astype(str).tolist()
+                summary["column_statistics"][col] = {"type": "other"}
             
             # Check for missing values
-            missing_values = df.isna().sum().to_dict()
-            missing_percentages = {col: count/len(df)*100 for col, count in missing_values.items() if count > 0}
+            na_counts = df.isna().sum()
+            na_counts = na_counts[na_counts > 0]
             summary["missing_values"] = {
-                "counts": {col: count for col, count in missing_values.items() if count > 0},
-                "percentages": missing_percentages
+                "counts": na_counts.astype('int64').to_dict(),
+                "percentages": (na_counts.astype('float64') / len(df) * 100).to_dict()
             }
             
             # Generate potential insights about the data
             insights = []
             
             # Check for date/time columns to suggest time series analysis
-            time_cols = [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col]) or 
-                         any(term in col.lower() for term in ["date", "time", "year", "month", "day"])]
+            time_cols = [col for col, dtype in dtypes.items() if dtype.kind == 'M' or
+                         _TIME_COLUMN_PATTERN.search(col)]
             if time_cols:
                 insights.append(f"Time-based data detected in column(s): {', '.join(time_cols)}. Consider time series analysis.")
             
@@ -199,13 +265,14 @@ class QueryBot:
                 if len(numeric_cols) >= 2:
                     corr_matrix = df[numeric_cols].corr().abs()
                     # Get pairs with correlation > 0.7 (excluding self-correlation)
-                    high_corr = []
-                    for i in range(len(corr_matrix.columns)):
-                        for j in range(i+1, len(corr_matrix.columns)):
-                            if corr_matrix.iloc[i, j] > 0.7:
-                                col1 = corr_matrix.columns[i]
-                                col2 = corr_matrix.columns[j]
-                                high_corr.append((col1, col2, corr_matrix.iloc[i, j]))
+                    # from the upper triangle in one vectorized comparison
+                    corr_values = corr_matrix.to_numpy()
+                    rows, cols = np.triu_indices_from(corr_values, k=1)
+                    strong = corr_values[rows, cols] > 0.7
+                    high_corr = [
+                        (corr_matrix.columns[i], corr_matrix.columns[j], corr_values[i, j])
+                        for i, j in zip(rows[strong], cols[strong])
+                    ]
                     
                     for col1, col2, corr in high_corr:
                         insights.append(f"Strong correlation ({corr:.2f}) detected between {col1} and {col2}.")
@@ -214,18 +281,18 @@ class QueryBot:
                 pass
                 
             # Check for potential categorical columns with low cardinality
-            for col in df.columns:
-                if col in summary["column_statistics"] and summary["column_statistics"][col]["type"] == "categorical":
-                    if summary["column_statistics"][col]["unique_count"] <= 10 and summary["column_statistics"][col]["unique_count"] > 1:
-                        insights.append(f"Column '{col}' may be a good candidate for categorical analysis with {summary['column_statistics'][col]['unique_count']} unique values.")
+            # using the cardinalities already computed for all string columns at once
+            for col, unique_count in string_nunique.items():
+                if 1 < unique_count <= 10:
+                    insights.append(f"Column '{col}' may be a good candidate for categorical analysis with {unique_count} unique values.")
             
             # Check for highly skewed numeric columns
             for col in df.columns:
                 if col in summary["column_statistics"] and summary["column_statistics"][col]["type"] == "numeric":
                     stats = summary["column_statistics"][col]["statistics"]
-                    if "mean" in stats and "50%" in stats and "max" in stats:
+                    if "mean" in stats and "max" in stats and ("median" in stats or "50%" in stats):
                         mean = stats["mean"]
-                        median = stats["50%"]
+                        median = stats.get("median", stats.get("50%"))
                         max_val = stats["max"]
                         # Check for skewed distribution
                         if mean / median > 1.5 or median / mean > 1.5:
@@ -240,6 +307,77 @@ class QueryBot:
             traceback.print_exc()
             return {"error": str(e)}
     
+    def _summary_to_compact(self, summary: dict) -> str:
+        """Render the data summary as one tab-separated row per column to keep prompts short."""
+        if "error" in summary:
+            return orjson.dumps(summary, default=str).decode()
+        
+        def fmt(value: Any) -> str:
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                return ""
+            if isinstance(value, (float, np.floating)):
+                return f"{value:.4g}"
+            return str(value)
+        
+        missing = summary.get("missing_values", {}).get("counts", {})
+        lines = [
+            f"rows={summary['row_count']} columns={summary['column_count']}",
+            "col\tdtype\tunique\tmean\tstd\tmin\tmax\tmedian\tmissing\tsamples"
+        ]
+        for col in summary["columns"]:
+            col_stats = summary["column_statistics"].get(col, {})
+            stats = col_stats.get("statistics", {})
+            samples = orjson.dumps(
+                summary["samples"].get(col, []),
+                default=str,
+                option=orjson.OPT_SERIALIZE_NUMPY
+            ).decode()
+            lines.append("\t".join([
+                str(col),
+                summary["data_types"].get(col, ""),
+                fmt(col_stats.get("unique_count")),
+                fmt(stats.get("mean")),
+                fmt(stats.get("std")),
+                fmt(stats.get("min", col_stats.get("min"))),
+                fmt(stats.get("max", col_stats.get("max"))),
+                fmt(stats.get("median", stats.get("50%"))),
+                fmt(missing.get(col)),
+                samples
+            ]))
+        
+        if summary.get("potential_insights"):
+            lines.append("insights:")
+            lines.extend(f"- {insight}" for insight in summary["potential_insights"])
+        
+        return "\n".join(lines)
+    
+    async def _cached_completion(self, **params: Any) -> Optional[str]:
+        """Chat completion text, memoized on the full request so identical prompts skip the round-trip."""
+        key = hashlib.blake2b(orjson.dumps(params, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+        cached = _cache_get(_answer_cache, key)
+        if cached is not None:
+            return cached
+        
+        response = await self.openai_client.chat.completions.create(**params)
+        content = response.choices[0].message.content
+        if content:
+            _cache_put(_answer_cache, key, content)
+        return content
+    
+    def _empty_sheet_response(self, sheet_id: str) -> dict:
+        """Helpful reply for a sheet with no data rows, instead of raising an error."""
+        return {
+            "text": "I couldn't analyze your data because the spreadsheet appears to be empty or contains only header rows. Please make sure your spreadsheet has data in it.",
+            "sourceSheetId": sheet_id,
+            "operation": "query",
+            "metadata": {
+                "rows_analyzed": 0,
+                "columns_analyzed": 0,
+                "executed_code": False,
+                "error": "Empty DataFrame"
+            }
+        }
+    
     async def analyze(self, request: Any, current_user: Dict = None):
         """
         Main entry point for conversational query requests.
@@ -252,7 +390,8 @@ class QueryBot:
                 for sheet_id, data in request.relevantData.items():
                     data_summary[sheet_id] = {
                         "rows": len(data) if isinstance(data, list) else "not an array",
-                        "totalCharacters": len(json.dumps(data)),
+                        # Estimated from one row rather than serializing the whole sheet
+                        "approxCharacters": len(json.dumps(data[-1])) * len(data) if isinstance(data, list) and data else 0,
                         "sample": json.dumps(data[:2])[:200] + "..." if isinstance(data, list) and data else "no data"
                     }
             
@@ -263,128 +402,130 @@ class QueryBot:
             source_data = request.relevantData.get(primary_sheet_id, [])
             primary_sheet_name = request.sheets.get(primary_sheet_id, {}).get('name', primary_sheet_id)
             
+            # No rows, or only a header row: nothing to build or summarize
+            if not source_data or (len(source_data) <= 1 and isinstance(source_data[0], list)):
+                return self._empty_sheet_response(primary_sheet_id)
+            
             # Convert data to pandas DataFrame
-            df = self._create_dataframe_from_raw(source_data)
+            loop = asyncio.get_running_loop()
+            df = await loop.run_in_executor(_CPU_EXECUTOR, self._create_dataframe_from_raw, source_data)
             if df.empty:
-                # Instead of raising an error, provide a helpful response
-                return {
-                    "text": "I couldn't analyze your data because the spreadsheet appears to be empty or contains only header rows. Please make sure your spreadsheet has data in it.",
-                    "sourceSheetId": primary_sheet_id,
-                    "operation": "query",
-                    "metadata": {
-                        "rows_analyzed": 0,
-                        "columns_analyzed": 0,
-                        "executed_code": False,
-                        "error": "Empty DataFrame"
-                    }
-                }
+                return self._empty_sheet_response(primary_sheet_id)
             
             # Get detailed data summary
-            detailed_summary = self._get_data_summary(df)
+            detailed_summary = await loop.run_in_executor(_CPU_EXECUTOR, self._get_data_summary, df)
             
-            # Create a JSON string of the data summary
-            summary_json = json.dumps(detailed_summary, default=str)
+            # Compact per-column table for the prompts; the full dict is far more tokens
+            summary_text = self._summary_to_compact(detailed_summary)
             
-            # Determine if code execution is needed using the LLM
-            code_decision_prompt = f"""
-            I have a DataFrame with this structure:
-            {summary_json}
+            # Same question against the same schema: reuse earlier LLM decisions/code
+            fingerprint = _schema_fingerprint(request.message, df)
             
-            User question: "{request.message}"
+            should_execute_code = _cache_get(_code_decision_cache, fingerprint)
+            if should_execute_code is None:
+                # Determine if code execution is needed using the LLM
+                code_decision_prompt = f"""
+                I have a DataFrame with this structure:
+                {summary_text}
             
-            Would this question require executing pandas code to answer accurately, or can it be answered
-            directly from looking at the data summary statistics?
+                User question: "{request.message}"
             
-            Consider:
-            1. Simple questions about column names, row counts, or data types can be answered directly
-            2. Questions requiring calculations, aggregations, filtering, or transformations require code
-            3. Questions about patterns, trends, correlations, or rankings usually require code
-            4. Questions asking for specific records or examples might require code
+                Would this question require executing pandas code to answer accurately, or can it be answered
+                directly from looking at the data summary statistics?
             
-            Answer with ONLY "needs_code" or "no_code" based on your assessment.
-            """
+                Consider:
+                1. Simple questions about column names, row counts, or data types can be answered directly
+                2. Questions requiring calculations, aggregations, filtering, or transformations require code
+                3. Questions about patterns, trends, correlations, or rankings usually require code
+                4. Questions asking for specific records or examples might require code
             
-            code_decision_response = self.openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a data analysis assistant that determines if Python code is needed to answer a question."},
-                    {"role": "user", "content": code_decision_prompt}
-                ],
-                temperature=0.1,
-                max_tokens=10
-            )
+                Answer with ONLY "needs_code" or "no_code" based on your assessment.
+                """
             
-            decision = code_decision_response.choices[0].message.content.strip().lower()
-            should_execute_code = "needs_code" in decision or "code" in decision
+                code_decision_response = await self.openai_client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=[
+                        {"role": "system", "content": "You are a data analysis assistant that determines if Python code is needed to answer a question."},
+                        {"role": "user", "content": code_decision_prompt}
+                    ],
+                    temperature=0.1,
+                    max_tokens=10
+                )
+            
+                decision = code_decision_response.choices[0].message.content.strip().lower()
+                should_execute_code = "needs_code" in decision or "code" in decision
+                _cache_put(_code_decision_cache, fingerprint, should_execute_code)
             
             # Create analysis prompt based on whether code execution is needed
             if should_execute_code:
                 # Complex query requires code execution
-                analysis_prompt = f"""
-                As a data expert, I need to answer this question about the data:
+                code = _cache_get(_analysis_code_cache, fingerprint)
+                if code is None:
+                    analysis_prompt = f"""
+                    As a data expert, I need to answer this question about the data:
                 
-                USER QUESTION: "{request.message}"
+                    USER QUESTION: "{request.message}"
                 
-                Here is information about the DataFrame (as JSON):
-                {summary_json}
+                    Here is information about the DataFrame (one tab-separated row per column):
+                    {summary_text}
                 
-                Write a function called `analyze_data` that takes a pandas DataFrame as input and returns a dictionary with the analysis results.
+                    Write a function called `analyze_data` that takes a pandas DataFrame as input and returns a dictionary with the analysis results.
                 
-                The function should:
-                1. NOT create any sample or test data - assume the DataFrame is passed as an argument
-                2. Return a dictionary containing the analysis results needed to answer the question
-                3. Handle errors, missing data, and edge cases with try/except blocks
-                4. Be concise and efficient
+                    The function should:
+                    1. NOT create any sample or test data - assume the DataFrame is passed as an argument
+                    2. Return a dictionary containing the analysis results needed to answer the question
+                    3. Handle errors, missing data, and edge cases with try/except blocks
+                    4. Be concise and efficient
+                    5. Use the `pd` (pandas) and `np` (numpy) names that are already loaded; do not write import statements
+                       (only pandas, numpy, math, datetime and a few other standard modules can be imported, and file or OS access is unavailable)
                 
-                ONLY return a properly structured Python function as shown in the example below, with no explanations or other text.
+                    ONLY return a properly structured Python function as shown in the example below, with no explanations or other text.
                 
-                Example return format:
-                ```python
-                def analyze_data(df):
-                    try:
-                        # Your analysis code here
-                        result = df['column'].mean()
-                        return {{"average": result}}
-                    except Exception as e:
-                        return {{"error": str(e)}}
-                ```
-                """
+                    Example return format:
+                    ```python
+                    def analyze_data(df):
+                        try:
+                            # Your analysis code here
+                            result = df['column'].mean()
+                            return {{"average": result}}
+                        except Exception as e:
+                            return {{"error": str(e)}}
+                    ```
+                    """
                 
-                # Get OpenAI analysis code
-                code_response = self.openai_client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": "You are a data analysis code generation API that returns properly structured Python functions. Return only valid Python code with no explanations or sample data."},
-                        {"role": "user", "content": analysis_prompt}
-                    ],
-                    temperature=0.2,
-                    max_tokens=1000
-                )
+                    # Get OpenAI analysis code
+                    code_response = await self.openai_client.chat.completions.create(
+                        model="gpt-4o",
+                        messages=[
+                            {"role": "system", "content": "You are a data analysis code generation API that returns properly structured Python functions. Return only valid Python code with no explanations or sample data."},
+                            {"role": "user", "content": analysis_prompt}
+                        ],
+                        temperature=0.2,
+                        max_tokens=1000
+                    )
                 
-                # Extract the code from the response
-                code_content = code_response.choices[0].message.content.strip()
+                    # Extract the code from the response
+                    code_content = code_response.choices[0].message.content.strip()
                 
-                # Extract just the code from between the python markdown tags
-                if "```python" in code_content and "```" in code_content.split("```python", 1)[1]:
-                    code = code_content.split("```python", 1)[1].split("```", 1)[0].strip()
-                else:
-                    # Fallback if markdown tags aren't properly formatted
-                    code = code_content.replace("```python", "").replace("```", "").strip()
+                    # Extract just the code from between the python markdown tags
+                    if "```python" in code_content and "```" in code_content.split("```python", 1)[1]:
+                        code = code_content.split("```python", 1)[1].split("```", 1)[0].strip()
+                    else:
+                        # Fallback if markdown tags aren't properly formatted
+                        code = code_content.replace("```python", "").replace("```", "").strip()
+                    _cache_put(_analysis_code_cache, fingerprint, code)
                 
                 print(f"Generated analysis code:\n{code}")
                 
                 # Execute the code in a safe environment
                 try:
-                    # Create a local scope with the necessary imports
-                    local_scope = {"pd": pd, "np": np}
-                    
-                    # Execute the function definition
-                    exec(code, {"pd": pd, "np": np}, local_scope)
+                    # Define the function, reusing the one built for identical code
+                    analyze_data = _load_analysis_function(hashlib.sha256(code.encode("utf-8")).digest(), code)
                     
-                    # Check if the function exists in the local scope
-                    if "analyze_data" in local_scope and callable(local_scope["analyze_data"]):
+                    # Check that the code defined a callable analyze_data
+                    if callable(analyze_data):
                         # Call the function with the DataFrame
-                        analysis_result = local_scope["analyze_data"](df)
+                        analysis_result = analyze_data(df)
                         print("Analysis result:", analysis_result)
                     else:
                         raise ValueError("The generated code did not define an 'analyze_data' function")
@@ -394,32 +535,12 @@ class QueryBot:
                     traceback.print_exc()
                     analysis_result = {"error": f"Error during analysis: {str(code_error)}"}
                 
-                # Execute the code in a safe environment
-                try:
-                    # Create a local scope with the DataFrame
-                    local_scope = {"df": df, "pd": pd, "np": np}
-                    
-                    # Execute the code
-                    exec(code, {"pd": pd, "np": np}, local_scope)
-                    
-                    # Get the response data
-                    if "response_data" in local_scope:
-                        analysis_result = local_scope["response_data"]
-                        print("Analysis result:", analysis_result)
-                    else:
-                        analysis_result = "Analysis completed, but no specific results were returned."
-                    
-                except Exception as code_error:
-                    print(f"Error executing analysis code: {str(code_error)}")
-                    traceback.print_exc()
-                    analysis_result = f"Error during analysis: {str(code_error)}"
-                
                 # Now we'll formulate a natural language response
                 response_prompt = f"""
                 USER QUESTION: "{request.message}"
                 
                 Data summary:
-                {summary_json}
+                {summary_text}
                 
                 Analysis result:
                 {analysis_result}
@@ -433,7 +554,7 @@ class QueryBot:
                 Instead, present the information as if you discovered these insights yourself.
                 """
                 
-                response = self.openai_client.chat.completions.create(
+                answer = await self._cached_completion(
                     model="gpt-4o",
                     messages=[
                         {"role": "system", "content": "You are a helpful data assistant that explains insights in plain language."},
@@ -443,8 +564,6 @@ class QueryBot:
                     max_tokens=800
                 )
                 
-                answer = response.choices[0].message.content
-                
             else:
                 # Simple query can be directly answered without code execution
                 query_prompt = f"""
@@ -452,15 +571,15 @@ class QueryBot:
                 
                 USER QUESTION: "{request.message}"
                 
-                Here is information about the DataFrame (as JSON):
-                {summary_json}
+                Here is information about the DataFrame (one tab-separated row per column):
+                {summary_text}
                 
                 Please provide a clear, concise answer to the user's question based on the data summary.
                 Make the answer conversational and easy to understand, avoiding technical jargon.
                 Include specific numbers and insights from the data summary if relevant.
                 """
                 
-                response = self.openai_client.chat.completions.create(
+                answer = await self._cached_completion(
                     model="gpt-4o",
                     messages=[
                         {"role": "system", "content": "You are a helpful data assistant that explains insights in plain language."},
@@ -469,8 +588,6 @@ class QueryBot:
                     temperature=0.5,
                     max_tokens=800
                 )
-                
-                answer = response.choices[0].message.content
             
             return {
                 "text": answer,
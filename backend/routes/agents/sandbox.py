@@ -0,0 +1,57 @@
+"""Execution policy shared by every agent that runs model-generated code."""
+import builtins
+import hashlib
+from functools import lru_cache
+from typing import Any, Dict
+
+# Top-level packages generated code may import; everything else (os, sys,
+# subprocess, builtins, ...) raises ImportError
+ALLOWED_IMPORTS = frozenset({
+    "pandas", "numpy", "math", "datetime", "statistics", "collections", "itertools",
+    "warnings", "scipy", "statsmodels", "sklearn", "matplotlib", "seaborn"
+})
+
+def _restricted_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """__import__ that only resolves absolute imports of ALLOWED_IMPORTS packages."""
+    if level != 0 or name.partition(".")[0] not in ALLOWED_IMPORTS:
+        raise ImportError(f"Import of '{name}' is not allowed in generated code")
+    return builtins.__import__(name, globals, locals, fromlist, level)
+
+# Builtins exposed to generated code: no open, eval, exec, compile, input or
+# interpreter introspection, and imports limited to the packages above. This
+# keeps generated snippets to data work; it is not a security boundary, since
+# allowed libraries can still reach the filesystem.
+SAFE_BUILTINS = {
+    name: getattr(builtins, name)
+    for name in (
+        "len", "range", "min", "max", "sum", "abs", "round", "pow", "divmod",
+        "float", "int", "str", "bool", "complex", "bytes", "list", "dict", "tuple", "set", "frozenset",
+        "slice", "object", "type", "super", "property", "staticmethod", "classmethod",
+        "enumerate", "zip", "sorted", "reversed", "any", "all", "map", "filter", "iter", "next",
+        "isinstance", "issubclass", "callable", "getattr", "hasattr", "setattr", "repr", "format",
+        "hash", "chr", "ord", "bin", "hex", "print", "__build_class__"
+    )
+}
+# The builtin exception and warning classes, so generated try/except blocks
+# (e.g. "except ImportError:" around an optional import) resolve; SystemExit,
+# KeyboardInterrupt and GeneratorExit stay out so snippets can't raise them
+SAFE_BUILTINS.update(
+    (name, value) for name, value in vars(builtins).items()
+    if isinstance(value, type) and issubclass(value, Exception)
+)
+SAFE_BUILTINS["BaseException"] = BaseException
+SAFE_BUILTINS["__import__"] = _restricted_import
+
+def sandbox_globals(**names: Any) -> Dict[str, Any]:
+    """Globals dict for exec'ing generated code with SAFE_BUILTINS plus the given names."""
+    # __name__ is read by class bodies when they set __module__
+    return {"__builtins__": SAFE_BUILTINS, "__name__": "generated", **names}
+
+@lru_cache(maxsize=512)
+def _compile_code(src_hash: bytes, src: str, filename: str):
+    return compile(src, filename, "exec")
+
+def compile_source(src: str, filename: str):
+    """Code object for a generated snippet, compiled once per distinct source and
+    filename (the filename names the agent in tracebacks, e.g. "<visualization>")."""
+    return _compile_code(hashlib.sha256(src.encode("utf-8")).digest(), src, filename)
@@ -1,21 +1,179 @@
-from typing import Dict, Any, List, Optional, Union
-from openai import OpenAI
+from typing import Dict, Any, List, Optional, Union, Callable, Awaitable
+from openai import AsyncOpenAI
 import os
 import json
+import orjson
+import asyncio
 from fastapi import HTTPException
 import pandas as pd
 import numpy as np
 import traceback
+import hashlib
+import copy
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import scipy.stats as stats
 import matplotlib.pyplot as plt
 import seaborn as sns
-from together import Together
+from together import AsyncTogether
+from routes.agents.sandbox import compile_source, sandbox_globals
 
 try:
     import statsmodels.api as sm
 except ImportError:
     sm = None
 
+# Column names that suggest date values, matched case-insensitively in one scan
+_DATE_COLUMN_PATTERN = re.compile(r"date|time|day|month|year", re.IGNORECASE)
+
+def _rows_with_data(df: pd.DataFrame) -> np.ndarray:
+    """Row mask: True where any cell is neither missing nor a blank string.
+    
+    Checked one column at a time, and the whitespace test only runs on object
+    columns, so no cell is ever copied into a fixed-width string array. Unlike
+    replace('', pd.NA).dropna(how='all'), rows of whitespace-only cells count
+    as empty too.
+    """
+    filled = np.zeros(len(df), dtype=bool)
+    for loc, dtype in enumerate(df.dtypes):
+        col = df.iloc[:, loc]
+        present = col.notna()
+        if dtype == object:
+            present &= ~col.astype(str).str.strip().eq('')
+        filled |= present.to_numpy()
+    return filled
+
+# Small bounded pool so generated analysis code never runs on the event loop;
+# threads share the loaded libraries and the DataFrame without pickling
+_EXEC_EXECUTOR = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+
+# pyplot keeps global figure state and is not thread-safe, so snippets that
+# touch matplotlib or seaborn run one at a time; the rest still run in parallel
+_PLOTTING_CODE_PATTERN = re.compile(r"\b(?:plt|sns|matplotlib|seaborn)\b")
+_PLOT_LOCK = threading.Lock()
+
+def _column_kinds(df: pd.DataFrame) -> Dict[str, frozenset]:
+    """Split columns into numeric/datetime/categorical sets, reusing the split stashed in df.attrs."""
+    kinds = df.attrs.get("_column_kinds")
+    if kinds is not None and kinds["columns"] == tuple(df.columns):
+        return kinds
+    
+    numeric, datetime, categorical = [], [], []
+    for col, dtype in df.dtypes.items():
+        if pd.api.types.is_numeric_dtype(dtype):
+            numeric.append(col)
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            datetime.append(col)
+        else:
+            categorical.append(col)
+    
+    kinds = {
+        "columns": tuple(df.columns),
+        "numeric": frozenset(numeric),
+        "datetime": frozenset(datetime),
+        "categorical": frozenset(categorical)
+    }
+    df.attrs["_column_kinds"] = kinds
+    return kinds
+
+# Chart types _generate_visualizations knows how to build
+_CHART_TYPES = frozenset({"bar", "line", "area", "scatter", "pie", "heatmap"})
+
+# Chart configs keyed by a digest of model, request, sheet ids, analysis result and sheet contents
+_CHART_CACHE_SIZE = 256
+_chart_cache: "OrderedDict[bytes, List[Dict[str, Any]]]" = OrderedDict()
+
+# Content-addressed LRU of correlation matrices, keyed by a digest of the numeric values
+_CORR_CACHE_SIZE = 128
+_corr_cache: "OrderedDict[bytes, pd.DataFrame]" = OrderedDict()
+
+# Interpretations keyed by a digest of model and prompt
+_INTERPRETATION_CACHE_SIZE = 1024
+_interpretation_cache: "OrderedDict[bytes, str]" = OrderedDict()
+
+# Static interpretation instructions come first so every request shares the
+# same prompt prefix; only the question, results and guide that follow vary.
+_INTERPRETATION_INSTRUCTIONS = """
+        Provide a clear, concise interpretation of the findings below that directly addresses the user's question.
+        Your response should be conversational and avoid technical jargon while still conveying the statistical insights accurately.
+        Include specific numbers and patterns found in the data.
+        
+        If the results include error information, do NOT mention technical errors. Instead, focus on what insights can still be drawn
+        from any partial results or basic data properties.
+        """
+
+_INTERPRETATION_SYSTEM_PROMPT = "You are a statistical interpreter who explains results clearly to non-experts."
+
+# Results serialized shorter than this are interpreted by the agent's small model
+_SMALL_INTERPRETATION_CHARS = 2000
+
+# orjson options for profiles and results embedded in prompts: NumPy values and non-string keys are accepted as-is
+_PROMPT_JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def _frame_digest(df: pd.DataFrame) -> Optional[bytes]:
+    """Digest of a DataFrame's columns, dtypes and values, or None when a cell can't be hashed."""
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    except TypeError:
+        return None
+    digest = hashlib.blake2b(row_hashes.tobytes(), digest_size=16)
+    digest.update(repr(list(df.columns)).encode("utf-8"))
+    digest.update(repr(df.dtypes.astype(str).tolist()).encode("utf-8"))
+    return digest.digest()
+
+def _mean_pivot(frame: pd.DataFrame, values: str, index: str, columns: str) -> pd.DataFrame:
+    """Mean of values per (index, columns) pair, zero where a pair has no data.
+
+    Equivalent to pivot_table(aggfunc='mean').fillna(0), but the two keys are
+    factorized once and the sums and counts come from single bincount passes.
+    """
+    vals = frame[values].to_numpy(dtype=float, na_value=np.nan)
+    # Rows with a missing value or key are left out, as in pivot_table
+    keep = ~np.isnan(vals) & frame[index].notna().to_numpy() & frame[columns].notna().to_numpy()
+    row_codes, row_labels = pd.factorize(frame[index][keep], sort=True)
+    col_codes, col_labels = pd.factorize(frame[columns][keep], sort=True)
+    n_rows, n_cols = len(row_labels), len(col_labels)
+    cells = row_codes * n_cols + col_codes
+    sums = np.bincount(cells, weights=vals[keep], minlength=n_rows * n_cols)
+    counts = np.bincount(cells, minlength=n_rows * n_cols)
+    means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+    return pd.DataFrame(means.reshape(n_rows, n_cols), index=row_labels, columns=col_labels)
+
+def _pearson_matrix(df: pd.DataFrame, columns: List[str], frame_digest: Optional[bytes] = None) -> pd.DataFrame:
+    """Pearson correlation matrix of the given numeric columns.
+    
+    Complete data goes through one BLAS matrix product on a column-major copy;
+    frames with missing values keep pandas' pairwise-complete corr().
+    A frame_digest from _frame_digest stands in for hashing the values again.
+    """
+    values = np.asfortranarray(df[columns].to_numpy(dtype=np.float64, na_value=np.nan))
+    
+    # Re-analyzing the same sheet is common, and corr() is a pure function of the values
+    digest = hashlib.blake2b(frame_digest if frame_digest is not None else values.tobytes(order="F"), digest_size=16)
+    digest.update(repr(list(columns)).encode("utf-8"))
+    key = digest.digest()
+    cached = _corr_cache.get(key)
+    if cached is not None:
+        _corr_cache.move_to_end(key)
+        return cached.copy()
+    
+    if len(values) < 2 or np.isnan(values).any():
+        corr_matrix = df[columns].corr()
+    else:
+        centered = values - values.mean(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            norms = np.sqrt(np.einsum("ij,ij->j", centered, centered))
+            corr = (centered.T @ centered) / np.outer(norms, norms)
+        np.clip(corr, -1.0, 1.0, out=corr)
+        corr_matrix = pd.DataFrame(corr, index=columns, columns=columns)
+    
+    _corr_cache[key] = corr_matrix
+    if len(_corr_cache) > _CORR_CACHE_SIZE:
+        _corr_cache.popitem(last=False)
+    return corr_matrix.copy()
+
 class StatisticalAgent:
     def __init__(self):
         """Initialize the EnhancedStatisticalAgent with the OpenAI client."""
@@ -24,15 +182,17 @@ class StatisticalAgent:
                 api_key = os.getenv("TOGETHER_API_KEY")
                 # export together api key to environment variable
                 os.environ["TOGETHER_API_KEY"] = api_key
-                self.client = Together()
+                self.client = AsyncTogether()
                 self.model = "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8"
+                self.small_model = self.model
             except Exception as e:
                 print(f"Error loading Together API: {str(e)}")
                 raise HTTPException(status_code=500, detail="Failed to load Together API.")
         else:
             try:
-                self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+                self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
                 self.model = "gpt-4o"
+                self.small_model = "gpt-4o-mini"
             except Exception as e:
                 print(f"Error loading OpenAI API: {str(e)}")
                 raise HTTPException(status_code=500, detail="Failed to load OpenAI API.")
@@ -49,61 +209,76 @@ class StatisticalAgent:
                 headers = raw_data[0]
                 
                 # Filter valid headers
-                valid_headers = []
-                valid_indices = []
-                for i, header in enumerate(headers):
-                    if header is not None and str(header).strip() != '':
-                        valid_headers.append(header)
-                        valid_indices.append(i)
+                valid_indices = [i for i, header in enumerate(headers)
+                                 if header is not None and str(header).strip() != '']
+                valid_headers = [headers[i] for i in valid_indices]
                 
-                # Filter data rows to include only valid columns and non-empty rows
-                cleaned_data = []
-                for row in raw_data[1:]:
-                    if len(row) >= len(headers):
-                        filtered_row = [row[i] for i in valid_indices]
-                        if any(val is not None and str(val).strip() != '' for val in filtered_row):
-                            cleaned_data.append(filtered_row)
-                
-                df = pd.DataFrame(cleaned_data, columns=valid_headers)
+                # Materialize the data rows as one object array (short rows are
+                # dropped, long ones trimmed) and keep only valid columns
+                rows = [row[:len(headers)] for row in raw_data[1:] if len(row) >= len(headers)]
+                if rows:
+                    values = np.empty((len(rows), len(headers)), dtype=object)
+                    values[:] = rows
+                    df = pd.DataFrame(values[:, valid_indices], columns=valid_headers)
+                    df = df[_rows_with_data(df)].reset_index(drop=True).infer_objects()
+                else:
+                    df = pd.DataFrame(columns=valid_headers)
                 
             else:
-                # Object format
-                filtered_data = []
-                for item in raw_data:
-                    # Keep only rows with at least one non-empty value
-                    if any(val is not None and str(val).strip() != '' for val in item.values()):
-                        filtered_data.append(item)
-                
-                df = pd.DataFrame(filtered_data)
+                # Object format, keeping only rows with at least one non-empty value
+                df = pd.DataFrame.from_records(raw_data)
+                if not df.empty:
+                    df = df[_rows_with_data(df)]
             
             # Additional data cleaning
             if not df.empty:
-                # Replace empty strings with NaN
-                df = df.replace('', pd.NA)
+                # Replace empty strings with NaN; only object columns can hold them
+                for loc, dtype in enumerate(df.dtypes):
+                    if dtype == object:
+                        col_values = df.iloc[:, loc]
+                        df.isetitem(loc, col_values.mask(col_values.eq(''), pd.NA))
                 
-                # Drop completely empty rows and columns
-                df = df.dropna(how='all')
-                df = df.dropna(axis=1, how='all')
+                # Drop completely empty rows and columns with one mask and a single slice
+                missing = df.isna()
+                df = df.loc[~missing.all(axis=1), ~missing.all(axis=0)]
                 
                 # Convert column names to be more analysis-friendly
                 df.columns = df.columns.str.strip().str.replace(' ', '_')
                 
                 # Convert numeric columns to appropriate data types
-                for col in df.columns:
-                    # Force numeric conversion for columns that look like numbers
-                    if df[col].apply(lambda x: isinstance(x, (int, float)) or
-                                   (isinstance(x, str) and x.replace('.', '', 1).isdigit())).all():
-                        df[col] = pd.to_numeric(df[col], errors='coerce')
+                for loc, (col, dtype) in enumerate(df.dtypes.items()):
+                    # Already-typed columns need no probing
+                    if dtype != object:
+                        continue
+                    
+                    # Convert only when every non-null value parses as a number, so no
+                    # text value is lost; one C-level to_numeric pass per column
+                    col_values = df.iloc[:, loc]
+                    numeric_values = pd.to_numeric(col_values, errors='coerce')
+                    parsed = numeric_values.notna()
+                    if parsed.any() and parsed.equals(col_values.notna()):
+                        df.isetitem(loc, numeric_values)
                     
                     # Try to convert date columns
-                    elif any(date_term in col.lower() for date_term in ['date', 'time', 'day', 'month', 'year']):
+                    elif _DATE_COLUMN_PATTERN.search(str(col)):
                         try:
-                            df[col] = pd.to_datetime(df[col], errors='coerce')
+                            df.isetitem(loc, pd.to_datetime(col_values, errors='coerce'))
                         except:
                             pass
                 
-                # Replace any infinity values with NaN
-                df = df.replace([np.inf, -np.inf], np.nan)
+                # Replace any infinity values with NaN; only float columns can hold them
+                float_cols = [col for col, dtype in df.dtypes.items() if dtype.kind == 'f']
+                if float_cols:
+                    float_values = df[float_cols]
+                    df[float_cols] = float_values.mask(np.isinf(float_values))
+                
+                # No numeric downcasting, on purpose. Floats stay float64: a float32
+                # downcast turns values like 19.99 into 19.989999771118164 in profiles,
+                # prompts and charts. Integers stay int64 because arithmetic in the
+                # generated code can silently wrap on int8/int16/int32 columns
+                
+                # Classify columns once for the profile and execution steps
+                _column_kinds(df)
                 
                 print(f"Created DataFrame with {len(df)} rows and {len(df.columns)} columns")
             
@@ -114,7 +289,7 @@ class StatisticalAgent:
             traceback.print_exc()
             return pd.DataFrame()
     
-    def _generate_data_profile(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def _generate_data_profile(self, df: pd.DataFrame, frame_digest: Optional[bytes] = None) -> Dict[str, Any]:
         """Generate a comprehensive data profile for analysis planning."""
         if df.empty:
             return {"empty": True}
@@ -129,10 +304,12 @@ class StatisticalAgent:
             "basic_stats": {}
         }
         
-        # Process each column
-        for col in df.columns:
-            col_type = str(df[col].dtype)
-            non_null_count = df[col].count()
+        kinds = _column_kinds(df)
+        
+        # Process each column, binding its Series once
+        for col, series in df.items():
+            col_type = str(series.dtype)
+            non_null_count = series.count()
             null_pct = (len(df) - non_null_count) / len(df) * 100 if len(df) > 0 else 0
             
             col_info = {
@@ -142,26 +319,27 @@ class StatisticalAgent:
             }
             
             # Add type-specific information
-            if pd.api.types.is_numeric_dtype(df[col]):
+            if col in kinds["numeric"]:
                 profile["numeric_columns"].append(col)
-                stats_dict = df[col].describe().to_dict()
+                stats_dict = series.describe().to_dict()
                 # Convert numpy types to Python types
                 col_stats = {k: float(v) if isinstance(v, (np.int64, np.float64)) else v 
                              for k, v in stats_dict.items()}
                 
                 col_info.update(col_stats)
                 
-                # Add to basic stats
+                # Add to basic stats, reusing describe() rather than rescanning the column;
+                # boolean columns describe as counts, so they are described as 0/1 floats
+                num_stats = stats_dict if "mean" in stats_dict else series.astype(float).describe().to_dict()
                 profile["basic_stats"][col] = {
-                    "mean": float(df[col].mean()) if not pd.isna(df[col].mean()) else None,
-                    "median": float(df[col].median()) if not pd.isna(df[col].median()) else None,
-                    "std": float(df[col].std()) if not pd.isna(df[col].std()) else None
+                    key: float(num_stats[source]) if not pd.isna(num_stats[source]) else None
+                    for key, source in (("mean", "mean"), ("median", "50%"), ("std", "std"))
                 }
                 
-            elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            elif col in kinds["datetime"]:
                 profile["datetime_columns"].append(col)
-                min_val = df[col].min()
-                max_val = df[col].max()
+                min_val = series.min()
+                max_val = series.max()
                 col_info.update({
                     "min": min_val.isoformat() if min_val is not pd.NaT else None,
                     "max": max_val.isoformat() if max_val is not pd.NaT else None,
@@ -170,87 +348,91 @@ class StatisticalAgent:
             else:
                 # Treat as categorical
                 profile["categorical_columns"].append(col)
-                value_counts = df[col].value_counts()
-                top_categories = value_counts.head(5).to_dict()
+                # Count values on factorized codes and only order the five most
+                # frequent (ties by first appearance) instead of sorting every category
+                codes, uniques = pd.factorize(series)
+                counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+                top_n = min(5, len(counts))
+                top = np.argpartition(-counts, top_n - 1)[:top_n] if top_n else np.array([], dtype=np.intp)
+                top = top[np.lexsort((top, -counts[top]))]
                 # Convert keys to strings for JSON serialization
-                top_categories = {str(k): int(v) for k, v in top_categories.items()}
+                top_categories = {str(uniques[i]): int(counts[i]) for i in top}
                 
                 col_info.update({
-                    "unique_count": int(df[col].nunique()),
+                    # factorize leaves missing values out, exactly like nunique()
+                    "unique_count": len(uniques),
                     "top_categories": top_categories
                 })
             
             profile["columns"][col] = col_info
         
         # Add correlation matrix for numeric columns if there are at least 2
+        corr_matrix = None
         if len(profile["numeric_columns"]) >= 2:
             try:
-                corr_matrix = df[profile["numeric_columns"]].corr().round(3)
+                corr_matrix = _pearson_matrix(df, profile["numeric_columns"], frame_digest).round(3)
                 
-                # Convert to a list of correlation data points for visualization
-                corr_data = []
-                for i, col1 in enumerate(corr_matrix.columns):
-                    for j, col2 in enumerate(corr_matrix.columns):
-                        corr_data.append({
-                            "x": col1,
-                            "y": col2,
-                            "value": float(corr_matrix.iloc[i, j])
-                        })
-                
-                profile["correlation_data"] = corr_data
+                # Keep the matrix as column names plus rows of values; one dict per
+                # cell would cost N^2 allocations and N^2 repeated labels in the prompt
+                profile["correlation_data"] = {
+                    "columns": corr_matrix.columns.tolist(),
+                    "matrix": corr_matrix.to_numpy(dtype=float).tolist()
+                }
             except Exception as e:
                 print(f"Error generating correlation matrix: {str(e)}")
         
         # Add data patterns and insights
-        profile["insights"] = self._generate_data_insights(df, profile)
+        profile["insights"] = self._generate_data_insights(df, profile, corr_matrix)
         
         return profile
     
-    def _generate_data_insights(self, df: pd.DataFrame, profile: Dict[str, Any]) -> List[str]:
+    def _generate_data_insights(self, df: pd.DataFrame, profile: Dict[str, Any],
+                                corr_matrix: Optional[pd.DataFrame] = None) -> List[str]:
         """Generate insights about the data for better analysis planning."""
         insights = []
         
-        # Check for highly correlated variables
-        if "correlation_data" in profile and profile["correlation_data"]:
-            high_corr_pairs = []
-            for item in profile["correlation_data"]:
-                if item["x"] != item["y"] and abs(item["value"]) > 0.7:
-                    high_corr_pairs.append((item["x"], item["y"], item["value"]))
+        # Check for highly correlated variables: each pair once from the upper
+        # triangle, strongest first
+        if corr_matrix is not None and profile.get("correlation_data"):
+            corr_values = corr_matrix.to_numpy()
+            rows, cols = np.triu_indices_from(corr_values, k=1)
+            pair_values = corr_values[rows, cols]
+            abs_values = np.abs(pair_values)
+            strong = np.flatnonzero(abs_values > 0.7)
+            strongest = strong[np.argsort(-abs_values[strong], kind="stable")]
             
-            if high_corr_pairs:
-                for x, y, val in high_corr_pairs[:3]:  # Limit to top 3
-                    insights.append(f"Strong {'positive' if val > 0 else 'negative'} correlation ({val:.2f}) between {x} and {y}")
+            for idx in strongest[:3]:  # Limit to top 3
+                x, y, val = corr_matrix.columns[rows[idx]], corr_matrix.columns[cols[idx]], pair_values[idx]
+                insights.append(f"Strong {'positive' if val > 0 else 'negative'} correlation ({val:.2f}) between {x} and {y}")
         
-        # Check for potential outliers in numeric columns
-        for col in profile["numeric_columns"]:
-            if "mean" in profile["basic_stats"][col] and "std" in profile["basic_stats"][col]:
-                mean = profile["basic_stats"][col]["mean"]
-                std = profile["basic_stats"][col]["std"]
-                
-                if mean is not None and std is not None and std > 0:
-                    try:
-                        # Check if there are values more than 3 standard deviations from mean
-                        outliers = df[(df[col] > mean + 3*std) | (df[col] < mean - 3*std)]
-                        if len(outliers) > 0:
-                            outlier_pct = len(outliers) / len(df) * 100
-                            insights.append(f"Potential outliers detected in {col}: {len(outliers)} rows ({outlier_pct:.1f}%)")
-                    except:
-                        pass
-        
-        # Check for skewed distributions
-        for col in profile["numeric_columns"]:
-            try:
-                if "mean" in profile["basic_stats"][col] and "median" in profile["basic_stats"][col]:
-                    mean = profile["basic_stats"][col]["mean"]
-                    median = profile["basic_stats"][col]["median"]
-                    
-                    if mean is not None and median is not None and median != 0:
-                        # Calculate skewness indicator
-                        skew_ratio = mean / median
-                        if skew_ratio > 1.5 or skew_ratio < 0.67:
-                            insights.append(f"Column {col} shows a skewed distribution (mean/median ratio: {skew_ratio:.2f})")
-            except:
-                pass
+        # Outliers and skew for all numeric columns at once, from the profile's
+        # mean/median/std and one float matrix of the values
+        numeric_cols = profile["numeric_columns"]
+        if numeric_cols:
+            def stat_vector(key: str) -> np.ndarray:
+                return np.array([
+                    np.nan if profile["basic_stats"][col].get(key) is None else profile["basic_stats"][col][key]
+                    for col in numeric_cols
+                ], dtype=float)
+            
+            means, medians, stds = stat_vector("mean"), stat_vector("median"), stat_vector("std")
+            
+            # Values more than 3 standard deviations from the mean; NaN never compares true
+            checked = np.isfinite(means) & (stds > 0)
+            if checked.any():
+                values = df[numeric_cols].to_numpy(dtype=float, na_value=np.nan)
+                with np.errstate(invalid="ignore"):
+                    outlier_counts = (np.abs(values - means) > 3 * stds).sum(axis=0)
+                for idx in np.flatnonzero(checked & (outlier_counts > 0)):
+                    count = int(outlier_counts[idx])
+                    insights.append(f"Potential outliers detected in {numeric_cols[idx]}: {count} rows ({count / len(df) * 100:.1f}%)")
+            
+            # Skewness indicator: mean/median ratio outside [0.67, 1.5]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                skew_ratios = means / medians
+            skewed = np.isfinite(skew_ratios) & (medians != 0) & ((skew_ratios > 1.5) | (skew_ratios < 0.67))
+            for idx in np.flatnonzero(skewed):
+                insights.append(f"Column {numeric_cols[idx]} shows a skewed distribution (mean/median ratio: {skew_ratios[idx]:.2f})")
         
         # Check for columns with high percentage of missing values
         for col, info in profile["columns"].items():
@@ -281,7 +463,7 @@ class StatisticalAgent:
 
         DATA PROFILE:
         ```json
-        {json.dumps(data_profile, indent=2)}
+        {orjson.dumps(data_profile, default=str, option=_PROMPT_JSON_OPTIONS).decode()}
         ```
 
         Create a comprehensive statistical analysis package including visualization with these components:
@@ -294,6 +476,9 @@ class StatisticalAgent:
         - Handle missing values, outliers, and other data issues
         - Create a dictionary called 'analysis_result' with ALL findings
         - Include comprehensive error handling
+        - pd, np, stats (scipy.stats), plt, sns and, when installed, sm (statsmodels.api) are already loaded;
+          only pandas, numpy, scipy, statsmodels, sklearn, matplotlib, seaborn and a few standard modules (math, datetime,
+          statistics, collections, itertools, warnings) can be imported, and file or OS access is unavailable
         - IMPORTANT: When working with date/datetime columns:
             - Don't use them directly in aggregation functions (sum, mean, etc.)
             - For time-based analysis, use the derived columns (e.g., Date_year, Date_month) that are automatically created
@@ -407,15 +592,19 @@ class StatisticalAgent:
         numeric_columns = ['Revenue', 'Profit', 'Units']
         for col in numeric_columns:
             if col in df.columns:
-                analysis_result['summary_statistics'][col] = {{
-                    'mean': df[col].mean(),
-                    'median': df[col].median(),
-                    'std': df[col].std(),
-                    'min': df[col].min(),
-                    'max': df[col].max(),
-                    'q1': df[col].quantile(0.25),
-                    'q3': df[col].quantile(0.75)
-                }}
+                # One quantile call yields min, quartiles and max in a single sort
+                values = df[col].dropna().to_numpy(dtype=float)
+                if len(values) > 0:
+                    min_val, q1, median, q3, max_val = np.quantile(values, [0.0, 0.25, 0.5, 0.75, 1.0])
+                    analysis_result['summary_statistics'][col] = {{
+                        'mean': values.mean(),
+                        'median': median,
+                        'std': values.std(ddof=1) if len(values) > 1 else None,
+                        'min': min_val,
+                        'max': max_val,
+                        'q1': q1,
+                        'q3': q3
+                    }}
 
         IMPORTANT SAFETY CHECKS:
             - ALWAYS check if a function return value is None before using it
@@ -447,7 +636,7 @@ class StatisticalAgent:
         """
 
         # Get analysis package from OpenAI
-        response = self.client.chat.completions.create(
+        response = await self.client.chat.completions.create(
             model=self.model,
             messages=[
                 {"role": "system", "content": "You are a statistical analysis API that returns robust, executable Python code without markdown formatting."},
@@ -489,68 +678,11 @@ class StatisticalAgent:
                 "error": "Failed to parse API response"
             }
     
-    def _execute_analysis(self, implementation_code: str, df: pd.DataFrame) -> Dict[str, Any]:
-        """Execute the statistical analysis code and return the results."""
+    async def _execute_analysis(self, implementation_code: str, df: pd.DataFrame) -> Dict[str, Any]:
+        """Execute the statistical analysis code off the event loop and return the results."""
         try:
-            # Make a copy of the DataFrame to avoid modifying the original
-            working_df = df.copy()
-            
-            # Check for datetime columns and create additional features
-            for col in working_df.columns:
-                if pd.api.types.is_datetime64_any_dtype(working_df[col]):
-                    # Create year, month, and day columns that can be used in aggregations
-                    working_df[f'{col}_year'] = working_df[col].dt.year
-                    working_df[f'{col}_month'] = working_df[col].dt.month
-                    working_df[f'{col}_day'] = working_df[col].dt.day
-                    print(f"Created date components for {col}")
-            
-            # Set up execution environment
-            execution_env = {
-                "df": working_df,
-                "pd": pd, 
-                "np": np, 
-                "stats": stats
-            }
-            
-            # Add optional libraries if available
-            if sm:
-                execution_env["sm"] = sm
-            execution_env["plt"] = plt
-            execution_env["sns"] = sns
-            
-            # Add a safe aggregation function
-            def safe_groupby_agg(dataframe, group_cols, agg_dict):
-                """Safely perform groupby aggregation, skipping datetime columns."""
-                try:
-                    # Filter agg_dict to only include columns that support the operations
-                    safe_agg_dict = {}
-                    for col, ops in agg_dict.items():
-                        if col in dataframe.columns and not pd.api.types.is_datetime64_any_dtype(dataframe[col]):
-                            safe_agg_dict[col] = ops
-                    
-                    if not safe_agg_dict:
-                        print(f"Warning: No aggregatable columns found for {group_cols}")
-                        return None
-                    
-                    result = dataframe.groupby(group_cols).agg(safe_agg_dict).reset_index()
-                    return result
-                except Exception as e:
-                    print(f"Error in safe_groupby_agg: {str(e)}")
-                    return None
-            
-            execution_env["safe_groupby_agg"] = safe_groupby_agg
-            
-            # Execute the implementation code
-            exec(implementation_code, execution_env)
-            
-            # Extract the analysis result
-            if "analysis_result" in execution_env:
-                result = execution_env["analysis_result"]
-                
-                # Convert to JSON-serializable format
-                return self._make_serializable(result)
-            else:
-                raise ValueError("No analysis_result found in execution environment")
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_EXEC_EXECUTOR, _run_analysis_code, implementation_code, df)
             
         except Exception as e:
             error_message = str(e)
@@ -565,7 +697,8 @@ class StatisticalAgent:
                 }
             )
     
-    def _make_serializable(self, obj: Any) -> Any:
+    @staticmethod
+    def _make_serializable(obj: Any) -> Any:
         """Convert Python objects to JSON-serializable format."""
         if isinstance(obj, (pd.DataFrame, pd.Series)):
             return obj.to_dict()
@@ -574,11 +707,11 @@ class StatisticalAgent:
         elif isinstance(obj, (np.int64, np.float64)):
             return float(obj)
         elif isinstance(obj, dict):
-            return {k: self._make_serializable(v) for k, v in obj.items()}
+            return {k: StatisticalAgent._make_serializable(v) for k, v in obj.items()}
         elif isinstance(obj, list):
-            return [self._make_serializable(v) for v in obj]
+            return [StatisticalAgent._make_serializable(v) for v in obj]
         elif isinstance(obj, tuple):
-            return [self._make_serializable(v) for v in obj]
+            return [StatisticalAgent._make_serializable(v) for v in obj]
         elif pd.isna(obj):
             return None
         else:
@@ -588,13 +721,54 @@ class StatisticalAgent:
             except:
                 return str(obj)
     
+    def _scatter_points(self, result_df: pd.DataFrame, x_col: str, y_col: str,
+                        group_by_col: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Build scatter points column-wise, skipping rows where x or y is missing."""
+        xs = pd.to_numeric(result_df[x_col], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        ys = pd.to_numeric(result_df[y_col], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        if "Customer_Name" in result_df.columns:
+            names = result_df["Customer_Name"].astype(str).to_numpy()
+        else:
+            names = np.array([f"Point {idx}" for idx in result_df.index], dtype=object)
+        keep = ~(np.isnan(xs) | np.isnan(ys))
+        
+        if group_by_col is None:
+            return [{"x": float(x), "y": float(y), "name": name}
+                    for x, y, name in zip(xs[keep], ys[keep], names[keep])]
+        
+        # Points are listed group by group, in order of first appearance
+        codes, groups = pd.factorize(result_df[group_by_col])
+        keep &= codes >= 0
+        order = np.flatnonzero(keep)
+        order = order[np.argsort(codes[order], kind="stable")]
+        group_labels = np.asarray(groups.astype(str))
+        return [{"x": float(xs[i]), "y": float(ys[i]), "name": names[i], "group": group_labels[codes[i]]}
+                for i in order]
+    
     async def _generate_visualizations(self, analysis_result: Dict[str, Any], df: pd.DataFrame, 
-                                source_sheet_id: str, target_sheet_id: str, original_request:str) -> List[Dict[str, Any]]:
-        """Generate visualizations based on analysis results."""
+                                source_sheet_id: str, target_sheet_id: str, original_request:str,
+                                frame_digest: Optional[bytes] = None) -> List[Dict[str, Any]]:
+        """Generate visualizations based on analysis results.
+        
+        frame_digest is the request's _frame_digest(df); without it nothing is cached.
+        """
+        
+        # The same request over the same result and sheet yields the same charts
+        cache_key = None
+        if frame_digest is not None:
+            digest = hashlib.blake2b(frame_digest, digest_size=16)
+            digest.update(f"{self.model}\n{source_sheet_id}\n{target_sheet_id}\n{original_request}\n".encode("utf-8"))
+            digest.update(orjson.dumps(analysis_result, default=str, option=_PROMPT_JSON_OPTIONS | orjson.OPT_SORT_KEYS))
+            cache_key = digest.digest()
+            cached = _chart_cache.get(cache_key)
+            if cached is not None:
+                _chart_cache.move_to_end(cache_key)
+                # Callers get their own copy so nothing they change leaks into the cache
+                return copy.deepcopy(cached)
         
         # Get a sample of the dataframe and column types to provide better context
         df_sample = df.head(3).to_dict('records')
-        column_types = {col: str(df[col].dtype) for col in df.columns}
+        column_types = df.dtypes.astype(str).to_dict()
         
         # Create visualization prompt with more detailed guidance
         # Note: All curly braces in code examples are doubled to escape them in f-strings
@@ -610,7 +784,7 @@ class StatisticalAgent:
         
         ANALYSIS RESULTS:
         ```json
-        {json.dumps(analysis_result, default=str, indent=2)}
+        {orjson.dumps(analysis_result, default=str, option=_PROMPT_JSON_OPTIONS).decode()}
         ```
 
         Create up to 3 visualization configurations that best answer the user's request.
@@ -708,7 +882,7 @@ class StatisticalAgent:
         """
 
         # Get visualization recommendations from OpenAI
-        response = self.client.chat.completions.create(
+        response = await self.client.chat.completions.create(
             model=self.model,
             messages=[
                 {"role": "system", "content": "You are a data visualization API that returns only valid JSON with detailed, executable Python code."},
@@ -730,12 +904,21 @@ class StatisticalAgent:
         chart_configs = []
         for viz_config in viz_configs:
             try:
+                # Configs that can't yield a chart are dropped before running their code
+                if viz_config.get("type") not in _CHART_TYPES:
+                    print(f"Warning: Unsupported chart type {viz_config.get('type')!r} for {viz_config.get('title', 'unknown')}")
+                    continue
+                if not viz_config.get("xAxisColumn") or not viz_config.get("yAxisColumns"):
+                    print(f"Warning: Missing axis columns for {viz_config.get('title', 'unknown')}")
+                    continue
+                
                 # Execute the data transformation code
-                local_scope = {"df": df, "pd": pd, "np": np}
-                exec(viz_config["dataTransformationCode"], local_scope)
+                local_scope = _ANALYSIS_GLOBALS.copy()
+                local_scope["df"] = df
+                exec(compile_source(viz_config["dataTransformationCode"], "<analysis>"), local_scope)
                 result_df = local_scope.get("result_df")
 
-                if result_df is None:
+                if result_df is None or result_df.empty:
                     print(f"Warning: No result_df produced for visualization {viz_config['title']}")
                     continue
                     
@@ -744,7 +927,9 @@ class StatisticalAgent:
                 if "groupByColumn" in viz_config and viz_config["groupByColumn"]:
                     required_cols.append(viz_config["groupByColumn"])
                     
-                missing_cols = [col for col in required_cols if col not in result_df.columns]
+                # One hash set of result columns serves every membership check below
+                result_cols = set(result_df.columns)
+                missing_cols = [col for col in required_cols if col not in result_cols]
                 if missing_cols:
                     print(f"Warning: Missing columns {missing_cols} in result_df for {viz_config['title']}")
                     continue
@@ -757,36 +942,36 @@ class StatisticalAgent:
                     # Get the groupByColumn if specified
                     group_by_col = viz_config.get("groupByColumn")
                     
-                    if group_by_col and group_by_col in result_df.columns:
-                        # Group data by the specified column
-                        for group_val in result_df[group_by_col].unique():
-                            group_data = result_df[result_df[group_by_col] == group_val]
-                            
-                            for _, row in group_data.iterrows():
-                                data_point = {
-                                    "name": str(row[viz_config["xAxisColumn"]]),
-                                    "group": str(group_val)  # Add group identifier
-                                }
-                                
-                                for y_col in viz_config["yAxisColumns"]:
-                                    try:
-                                        data_point[y_col] = float(row[y_col])
-                                    except (ValueError, TypeError):
-                                        data_point[y_col] = 0
-                                
-                                chart_data.append(data_point)
+                    if group_by_col and group_by_col in result_cols:
+                        # One factorize pass orders rows group by group (first appearance
+                        # first) instead of re-filtering the frame for every group
+                        codes, groups = pd.factorize(result_df[group_by_col])
+                        order = np.flatnonzero(codes >= 0)
+                        order = order[np.argsort(codes[order], kind="stable")]
+                        group_labels = np.asarray(groups.astype(str))[codes[order]].tolist()
                     else:
                         # No grouping - standard bar/line chart
-                        for _, row in result_df.iterrows():
-                            data_point = {"name": str(row[viz_config["xAxisColumn"]])}
-                            
-                            for y_col in viz_config["yAxisColumns"]:
-                                try:
-                                    data_point[y_col] = float(row[y_col])
-                                except (ValueError, TypeError):
-                                    data_point[y_col] = 0
-                                    
-                            chart_data.append(data_point)
+                        order = np.arange(len(result_df))
+                        group_labels = None
+                    
+                    names = result_df[viz_config["xAxisColumn"]].iloc[order].astype(str).tolist()
+                    # Coerce each y column in one sweep; values that are missing or
+                    # don't parse as numbers are plotted as 0
+                    y_values = {
+                        y_col: pd.to_numeric(result_df[y_col].iloc[order], errors='coerce')
+                            .astype(float).fillna(0).tolist()
+                        for y_col in viz_config["yAxisColumns"]
+                    }
+                    
+                    for i, name in enumerate(names):
+                        data_point = {"name": name}
+                        if group_labels is not None:
+                            data_point["group"] = group_labels[i]  # Add group identifier
+                        
+                        for y_col in viz_config["yAxisColumns"]:
+                            data_point[y_col] = y_values[y_col][i]
+                        
+                        chart_data.append(data_point)
                     
                 elif viz_config["type"] == "scatter":
                     # For scatter plots, ensure both x and y are numeric
@@ -794,61 +979,45 @@ class StatisticalAgent:
                     pd.api.types.is_numeric_dtype(result_df[viz_config["yAxisColumns"][0]]):
                         
                         group_by_col = viz_config.get("groupByColumn")
-                        
-                        if group_by_col and group_by_col in result_df.columns:
-                            # Group scatter points
-                            for group_val in result_df[group_by_col].unique():
-                                group_data = result_df[result_df[group_by_col] == group_val]
-                                
-                                for _, row in group_data.iterrows():
-                                    chart_data.append({
-                                        "x": float(row[viz_config["xAxisColumn"]]),
-                                        "y": float(row[viz_config["yAxisColumns"][0]]),
-                                        "name": str(row.get("Customer_Name", f"Point {_}")),
-                                        "group": str(group_val)
-                                    })
-                        else:
-                            # No grouping
-                            for _, row in result_df.iterrows():
-                                chart_data.append({
-                                    "x": float(row[viz_config["xAxisColumn"]]),
-                                    "y": float(row[viz_config["yAxisColumns"][0]]),
-                                    "name": str(row.get("Customer_Name", f"Point {_}"))
-                                })
+                        if not (group_by_col and group_by_col in result_cols):
+                            group_by_col = None
+                        chart_data = self._scatter_points(
+                            result_df, viz_config["xAxisColumn"], viz_config["yAxisColumns"][0], group_by_col
+                        )
                     else:
                         print(f"Warning: Non-numeric columns used for scatter plot in {viz_config['title']}")
                         continue
                         
                 elif viz_config["type"] == "pie":
-                    for _, row in result_df.iterrows():
-                        try:
-                            value = float(row[viz_config["yAxisColumns"][0]])
-                            chart_data.append({
-                                "name": str(row[viz_config["xAxisColumn"]]),
-                                "value": value
-                            })
-                        except (ValueError, TypeError):
-                            continue
+                    # Coerce the values once and keep only the slices that parsed
+                    values = pd.to_numeric(result_df[viz_config["yAxisColumns"][0]], errors='coerce')
+                    keep = values.notna()
+                    names = result_df.loc[keep, viz_config["xAxisColumn"]].astype(str).tolist()
+                    chart_data = [
+                        {"name": name, "value": value}
+                        for name, value in zip(names, values[keep].astype(float).tolist())
+                    ]
                             
                 elif viz_config["type"] == "heatmap":
                     try:
                         # Create a pivot table for heatmap
                         if len(viz_config["yAxisColumns"]) > 1:
-                            pivot = pd.pivot_table(
+                            pivot = _mean_pivot(
                                 result_df,
                                 values=viz_config["yAxisColumns"][0],
                                 index=viz_config["xAxisColumn"],
-                                columns=viz_config["yAxisColumns"][1],
-                                aggfunc='mean'
-                            ).fillna(0)
-
-                            for idx_val in pivot.index:
-                                for col_val in pivot.columns:
-                                    chart_data.append({
-                                        "x": str(idx_val),
-                                        "y": str(col_val),
-                                        "value": float(pivot.loc[idx_val, col_val])
-                                    })
+                                columns=viz_config["yAxisColumns"][1]
+                            )
+
+                            # Read the grid as one array rather than a .loc lookup per cell
+                            grid = pivot.to_numpy(dtype=float).tolist()
+                            col_labels = [str(col_val) for col_val in pivot.columns]
+                            for idx_val, row_values in zip(pivot.index, grid):
+                                x_label = str(idx_val)
+                                chart_data.extend(
+                                    {"x": x_label, "y": y_label, "value": value}
+                                    for y_label, value in zip(col_labels, row_values)
+                                )
                         else:
                             print(f"Warning: Not enough dimensions for heatmap in {viz_config['title']}")
                             continue
@@ -880,6 +1049,10 @@ class StatisticalAgent:
                 traceback.print_exc()
                 continue
 
+        if chart_configs and cache_key is not None:
+            _chart_cache[cache_key] = copy.deepcopy(chart_configs)
+            if len(_chart_cache) > _CHART_CACHE_SIZE:
+                _chart_cache.popitem(last=False)
         return chart_configs
     
     async def _generate_tables(self, analysis_result: Dict[str, Any], df: pd.DataFrame, 
@@ -907,7 +1080,7 @@ class StatisticalAgent:
 
             ANALYSIS RESULTS:
             ```json
-            {json.dumps(analysis_result, default=str, indent=2)}
+            {orjson.dumps(analysis_result, default=str, option=_PROMPT_JSON_OPTIONS).decode()}
             ```
 
             DATAFRAME INFO:
@@ -984,7 +1157,7 @@ class StatisticalAgent:
             """
 
         # Get table recommendations from OpenAI
-        response = self.client.chat.completions.create(
+        response = await self.client.chat.completions.create(
             model=self.model,
             messages=[
                 {"role": "system", "content": "You are a data presentation API. Return only valid JSON with no comments, no markdown, and no explanation."},
@@ -1009,15 +1182,12 @@ class StatisticalAgent:
         for table_config in table_configs:
             try:
                 # Execute the data transformation code
-                local_scope = {
-                    "df": df, 
-                    "pd": pd, 
-                    "np": np, 
-                    "analysis_result": analysis_result
-                }
+                local_scope = _ANALYSIS_GLOBALS.copy()
+                local_scope["df"] = df
+                local_scope["analysis_result"] = analysis_result
                 
                 # Execute the data transformation code
-                exec(table_config["dataTransformationCode"], local_scope)
+                exec(compile_source(table_config["dataTransformationCode"], "<analysis>"), local_scope)
                 result_df = local_scope.get("result_df")
 
                 if result_df is None or result_df.empty:
@@ -1025,19 +1195,23 @@ class StatisticalAgent:
                     continue
 
                 # Convert result to serializable format (records)
-                table_data = []
-                for _, row in result_df.iterrows():
-                    # Convert each cell to an appropriate type for JSON serialization
-                    row_dict = {}
-                    for col in result_df.columns:
-                        cell_value = row[col]
-                        if isinstance(cell_value, (np.int64, np.float64)):
-                            row_dict[col] = float(cell_value)
-                        elif pd.isna(cell_value):
-                            row_dict[col] = None
-                        else:
-                            row_dict[col] = str(cell_value)
-                    table_data.append(row_dict)
+                # Convert column by column, then zip the columns into rows:
+                # numeric columns become floats (NaN -> None), other cells
+                # become strings or None
+                table_columns = result_df.columns.tolist()
+                column_values = []
+                for col in table_columns:
+                    series = result_df[col]
+                    if series.dtype.kind in 'iuf':
+                        column_values.append([None if v != v else v for v in series.astype(float).tolist()])
+                    else:
+                        column_values.append([
+                            float(v) if isinstance(v, (np.int64, np.float64))
+                            else None if pd.isna(v)
+                            else str(v)
+                            for v in series.tolist()
+                        ])
+                table_data = [dict(zip(table_columns, row)) for row in zip(*column_values)]
 
                 # Get column types for formatting
                 column_types = {}
@@ -1080,8 +1254,13 @@ class StatisticalAgent:
         
     async def _generate_interpretation(self, user_message: str, analysis_type: str, 
                                    analysis_result: Dict[str, Any], 
-                                   interpretation_guide: str) -> str:
-        """Generate user-friendly interpretation of analysis results."""
+                                   interpretation_guide: str,
+                                   on_token: Optional[Callable[[str], Awaitable[None]]] = None) -> str:
+        """Generate user-friendly interpretation of analysis results.
+        
+        The completion is streamed; when on_token is given it receives each text
+        fragment as it arrives, so callers can forward the interpretation early.
+        """
         # Clean up the result for presentation
         cleaned_result = {}
         for key, value in analysis_result.items():
@@ -1089,45 +1268,69 @@ class StatisticalAgent:
             if key not in ["error", "traceback"] and not (isinstance(value, dict) and len(value) > 20):
                 cleaned_result[key] = value
         
-        # Create interpretation prompt
-        prompt = f"""
+        results_json = orjson.dumps(cleaned_result, default=str, option=_PROMPT_JSON_OPTIONS).decode()
+        
+        # Short results only need paraphrasing; the small model does that faster
+        model = self.small_model if len(results_json) < _SMALL_INTERPRETATION_CHARS else self.model
+        
+        # Create interpretation prompt: the fixed instructions followed by the request-specific tail
+        prompt = f"""{_INTERPRETATION_INSTRUCTIONS}
         USER QUESTION: "{user_message}"
         
         ANALYSIS TYPE: {analysis_type}
         
         ANALYSIS RESULTS:
         ```json
-        {json.dumps(cleaned_result, default=str, indent=2)}
+        {results_json}
         ```
         
         INTERPRETATION GUIDE:
         {interpretation_guide}
-        
-        Based on the above, provide a clear, concise interpretation of the findings that directly addresses the user's question.
-        Your response should be conversational and avoid technical jargon while still conveying the statistical insights accurately.
-        Include specific numbers and patterns found in the data.
-        
-        If the results include error information, do NOT mention technical errors. Instead, focus on what insights can still be drawn
-        from any partial results or basic data properties.
         """
         
+        # Identical analysis results produce an identical prompt; reuse the earlier answer
+        cache_key = hashlib.blake2b(f"{model}\n{prompt}".encode("utf-8"), digest_size=16).digest()
+        cached = _interpretation_cache.get(cache_key)
+        if cached is not None:
+            _interpretation_cache.move_to_end(cache_key)
+            if on_token is not None:
+                await on_token(cached)
+            return cached
+        
         # Get interpretation from OpenAI
-        response = self.client.chat.completions.create(
-            model=self.model,
+        stream = await self.client.chat.completions.create(
+            model=model,
             messages=[
-                {"role": "system", "content": "You are a statistical interpreter who explains results clearly to non-experts."},
+                {"role": "system", "content": _INTERPRETATION_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.2,
-            max_tokens=800
+            max_tokens=800,
+            stream=True
         )
         
-        return response.choices[0].message.content
+        parts = []
+        async for chunk in stream:
+            if chunk.choices:
+                token = chunk.choices[0].delta.content or ""
+                if token:
+                    parts.append(token)
+                    if on_token is not None:
+                        await on_token(token)
+        
+        interpretation = "".join(parts)
+        if interpretation:
+            _interpretation_cache[cache_key] = interpretation
+            if len(_interpretation_cache) > _INTERPRETATION_CACHE_SIZE:
+                _interpretation_cache.popitem(last=False)
+        return interpretation
     
-    async def analyze(self, request: Any, current_user: Dict = None) -> Dict[str, Any]:
+    async def analyze(self, request: Any, current_user: Dict = None,
+                      on_token: Optional[Callable[[str], Awaitable[None]]] = None) -> Dict[str, Any]:
         """
         Main entry point for statistical analysis requests.
         Provides comprehensive statistical analysis based on user request.
+        When on_token is given, interpretation text is passed to it as it streams in.
         """
         try:
             # Extract relevant information
@@ -1135,8 +1338,8 @@ class StatisticalAgent:
             source_data = request.relevantData.get(primary_sheet_id, [])
             target_sheet_id = request.explicitTargetSheetId or request.activeSheetId
             
-            # Convert raw data to DataFrame with thorough cleaning
-            df = self._create_dataframe_from_raw(source_data)
+            # Convert raw data to DataFrame with thorough cleaning (skipped when there is no data at all)
+            df = self._create_dataframe_from_raw(source_data) if source_data else pd.DataFrame()
             
             # Handle empty DataFrame
             if df.empty:
@@ -1145,8 +1348,11 @@ class StatisticalAgent:
                     detail="Empty dataset provided for analysis"
                 )
             
+            # Hash the sheet once; the correlation and chart caches both key on it
+            frame_digest = _frame_digest(df)
+            
             # Generate comprehensive data profile
-            data_profile = self._generate_data_profile(df)
+            data_profile = self._generate_data_profile(df, frame_digest)
             
             # Create and execute statistical analysis
             analysis_package = await self._create_statistical_analysis(request.message, df, data_profile)
@@ -1154,23 +1360,23 @@ class StatisticalAgent:
             # Execute the analysis code
             print("CODE GENERATED:\n</>\n")
             print(analysis_package["implementation"]+"\n")
-            analysis_result = self._execute_analysis(analysis_package["implementation"], df)
+            analysis_result = await self._execute_analysis(analysis_package["implementation"], df)
 
             print("ANALYSIS RESULT:")
-            print(json.dumps(analysis_result, indent=2)+"\n")
-            
-            # Generate visualizations
-            chart_configs = await self._generate_visualizations(analysis_result, df, primary_sheet_id, target_sheet_id, request.message)
+            print(orjson.dumps(analysis_result, default=str, option=_PROMPT_JSON_OPTIONS).decode()+"\n")
             
-            # Generate tables
-            table_configs = await self._generate_tables(analysis_result, df, primary_sheet_id, target_sheet_id, request.message)
-            
-            # Generate interpretation
-            interpretation = await self._generate_interpretation(
-                request.message,
-                analysis_package.get("analysis_type", "Statistical Analysis"),
-                analysis_result,
-                analysis_package.get("interpretation_guide", "")
+            # Charts, tables and the interpretation only depend on the analysis
+            # result, so their LLM round-trips run concurrently
+            chart_configs, table_configs, interpretation = await asyncio.gather(
+                self._generate_visualizations(analysis_result, df, primary_sheet_id, target_sheet_id, request.message, frame_digest),
+                self._generate_tables(analysis_result, df, primary_sheet_id, target_sheet_id, request.message),
+                self._generate_interpretation(
+                    request.message,
+                    analysis_package.get("analysis_type", "Statistical Analysis"),
+                    analysis_result,
+                    analysis_package.get("interpretation_guide", ""),
+                    on_token=on_token
+                )
             )
             
             # Return the final response
@@ -1200,4 +1406,70 @@ class StatisticalAgent:
                     "error": str(e),
                     "traceback": traceback.format_exc()
                 }
-            )
\ No newline at end of file
+            )
+
+
+def _safe_groupby_agg(dataframe, group_cols, agg_dict):
+    """Safely perform groupby aggregation, skipping datetime columns."""
+    try:
+        # Filter agg_dict to only include columns that support the operations
+        safe_agg_dict = {}
+        for col, ops in agg_dict.items():
+            if col in dataframe.columns and not pd.api.types.is_datetime64_any_dtype(dataframe[col]):
+                safe_agg_dict[col] = ops
+        
+        if not safe_agg_dict:
+            print(f"Warning: No aggregatable columns found for {group_cols}")
+            return None
+        
+        result = dataframe.groupby(group_cols).agg(safe_agg_dict).reset_index()
+        return result
+    except Exception as e:
+        print(f"Error in safe_groupby_agg: {str(e)}")
+        return None
+
+# Globals every generated snippet (analysis, chart and table code) runs with,
+# built once and copied per run: the shared sandbox builtins plus the
+# libraries the prompts promise; optional libraries only when installed
+_ANALYSIS_GLOBALS = sandbox_globals(
+    pd=pd,
+    np=np,
+    stats=stats,
+    plt=plt,
+    sns=sns,
+    safe_groupby_agg=_safe_groupby_agg,
+    **({"sm": sm} if sm else {})
+)
+
+def _run_analysis_code(implementation_code: str, df: pd.DataFrame) -> Dict[str, Any]:
+    """Run generated analysis code against a copy of df and return a serializable result."""
+    # Make a copy of the DataFrame to avoid modifying the original
+    working_df = df.copy()
+    
+    # Check for datetime columns and create additional features
+    datetime_cols = _column_kinds(df)["datetime"]
+    for col in [col for col in df.columns if col in datetime_cols]:
+        # Create year, month, and day columns that can be used in aggregations
+        working_df[f'{col}_year'] = working_df[col].dt.year
+        working_df[f'{col}_month'] = working_df[col].dt.month
+        working_df[f'{col}_day'] = working_df[col].dt.day
+        print(f"Created date components for {col}")
+    
+    # Set up execution environment from the prebuilt globals
+    execution_env = _ANALYSIS_GLOBALS.copy()
+    execution_env["df"] = working_df
+    
+    # Execute the implementation code, reusing the compiled code object
+    code = compile_source(implementation_code, "<analysis>")
+    if _PLOTTING_CODE_PATTERN.search(implementation_code):
+        with _PLOT_LOCK:
+            exec(code, execution_env)
+    else:
+        exec(code, execution_env)
+    
+    # Extract the analysis result
+    if "analysis_result" not in execution_env:
+        raise ValueError("No analysis_result found in execution environment")
+    
+    # Convert to JSON-serializable format
+    return StatisticalAgent._make_serializable(execution_env["analysis_result"])
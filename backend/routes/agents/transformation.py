@@ -1,11 +1,21 @@
 from typing import Dict, Any, List, Optional, Union
-from openai import OpenAI
+from openai import AsyncOpenAI
 import os
 import json
+import re
 import pandas as pd
 from fastapi import HTTPException
 import traceback
-from together import Together
+from together import AsyncTogether
+from routes.agents.sandbox import compile_source
+
+# Operation type reported for a request, checked in order; word-start matches so
+# "border" or "nowhere" don't count while "filtered" and "ordering" still do
+_OPERATION_TYPE_PATTERNS = (
+    ("filter", re.compile(r"\b(?:filter|where)", re.IGNORECASE)),
+    ("aggregate", re.compile(r"\b(?:group|aggregat)", re.IGNORECASE)),
+    ("sort", re.compile(r"\b(?:sort|order)", re.IGNORECASE)),
+)
 
 class DataTransformationAgent:
     def __init__(self):
@@ -15,14 +25,14 @@ class DataTransformationAgent:
                 api_key = os.getenv("TOGETHER_API_KEY")
                 # export together api key to environment variable
                 os.environ["TOGETHER_API_KEY"] = api_key
-                self.client = Together()
+                self.client = AsyncTogether()
                 self.model = "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8"
             except Exception as e:
                 print(f"Error loading Together API: {str(e)}")
                 raise HTTPException(status_code=500, detail="Failed to load Together API.")
         else:
             try:
-                self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+                self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
                 self.model = "gpt-4o"
             except Exception as e:
                 print(f"Error loading OpenAI API: {str(e)}")
@@ -49,6 +59,21 @@ class DataTransformationAgent:
             print(f"Error creating DataFrame: {str(e)}")
             return pd.DataFrame()
 
+    @staticmethod
+    def _missing_column(error: Exception, df: pd.DataFrame) -> Optional[Any]:
+        """The column label behind a KeyError from pandas column lookup, or None for any other error."""
+        if not isinstance(error, KeyError) or len(error.args) != 1:
+            return None
+        key = error.args[0]
+        if not (pd.api.types.is_scalar(key) and pd.api.types.is_hashable(key)) or key in df.columns:
+            return None
+        # pandas raises KeyError(label) from Index.get_loc; a dict lookup in the
+        # generated code raises from the generated frame instead
+        tb = error.__traceback__
+        while tb is not None and tb.tb_next is not None:
+            tb = tb.tb_next
+        return key if tb is not None and tb.tb_frame.f_code.co_name == "get_loc" else None
+    
     def _convert_dataframe_to_list(self, df: pd.DataFrame) -> List:
         """Convert DataFrame back to list format for response."""
         if df.empty:
@@ -78,7 +103,7 @@ class DataTransformationAgent:
         
         # Convert to list of lists, handling potential special values
         data_rows = []
-        for _, row in df_clean.iterrows():
+        for row in df_clean.itertuples(index=False, name=None):
             data_row = []
             for val in row:
                 # Additional safety check for any special values that might remain
@@ -107,7 +132,8 @@ class DataTransformationAgent:
                 for sheet_id, data in request.relevantData.items():
                     data_summary[sheet_id] = {
                         "rows": len(data) if isinstance(data, list) else "not an array",
-                        "totalCharacters": len(json.dumps(data)),
+                        # Estimated from one row rather than serializing the whole sheet
+                        "approxCharacters": len(json.dumps(data[-1])) * len(data) if isinstance(data, list) and data else 0,
                         "sample": json.dumps(data[:2])[:200] + "..." if isinstance(data, list) and data else "no data"
                     }
             
@@ -118,6 +144,10 @@ class DataTransformationAgent:
             source_data = request.relevantData.get(primary_sheet_id, [])
             primary_sheet_name = request.sheets.get(primary_sheet_id, {}).get('name', primary_sheet_id)
             
+            # Nothing to work on: skip DataFrame construction altogether
+            if not source_data:
+                raise ValueError("Could not create DataFrame from the provided data")
+            
             # Convert data to pandas DataFrame
             df = self._create_dataframe_from_raw(source_data)
             if df.empty:
@@ -185,7 +215,7 @@ class DataTransformationAgent:
             """
             
             # Get GPT-generated pandas code
-            code_response = self.client.chat.completions.create(
+            code_response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a pandas code generation API. Return only valid Python code with no comments, no markdown formatting, and no explanation."},
@@ -217,7 +247,7 @@ class DataTransformationAgent:
                 local_scope = {"df": df, "pd": pd, "np": np}
                 
                 # Execute the code
-                exec(code, {"pd": pd, "np": np}, local_scope)
+                exec(compile_source(code, "<transformation>"), {"pd": pd, "np": np}, local_scope)
                 
                 # Get the result DataFrame
                 if "result_df" in local_scope:
@@ -248,13 +278,10 @@ class DataTransformationAgent:
                 transformation_description = f"I transformed your data based on your request: \"{request.message}\". The result contains {len(result_df)} rows and {len(result_df.columns)} columns."
                 
                 # Determine operation type from request (simplified)
-                operation_type = "transformation"
-                if "filter" in request.message.lower() or "where" in request.message.lower():
-                    operation_type = "filter"
-                elif "group" in request.message.lower() or "aggregate" in request.message.lower():
-                    operation_type = "aggregate"
-                elif "sort" in request.message.lower() or "order" in request.message.lower():
-                    operation_type = "sort"
+                operation_type = next(
+                    (op for op, pattern in _OPERATION_TYPE_PATTERNS if pattern.search(request.message or "")),
+                    "transformation"
+                )
                 
                 # Prepare the response
                 return {
@@ -269,6 +296,19 @@ class DataTransformationAgent:
                 print(f"Error executing pandas code: {str(code_error)}")
                 traceback.print_exc()
                 
+                # A reference to a column the sheet doesn't have can't be fixed by
+                # regenerating code without the column list; tell the user which
+                # columns exist instead of spending another completion round-trip
+                missing_column = self._missing_column(code_error, df)
+                if missing_column is not None:
+                    raise HTTPException(
+                        status_code=400,
+                        detail={
+                            "error": "Column not found",
+                            "text": f"I couldn't find a column named {missing_column!r}. Available columns: {', '.join(map(str, df.columns))}."
+                        }
+                    )
+                
                 # Generate a better error message using GPT
                 error_prompt = f"""
                 I tried to execute this pandas code:
@@ -283,8 +323,8 @@ class DataTransformationAgent:
                 """
                 
                 # Get improved code
-                improved_code_response = self.openai_client.chat.completions.create(
-                    model="gpt-4o",
+                improved_code_response = await self.client.chat.completions.create(
+                    model=self.model,
                     messages=[
                         {"role": "system", "content": "You are a pandas code debugging API. Return only valid Python code with no comments, no markdown formatting, and no explanation."},
                         {"role": "user", "content": error_prompt}
@@ -313,7 +353,7 @@ class DataTransformationAgent:
                     local_scope = {"df": df, "pd": pd, "np": np}
                     
                     # Execute the improved code
-                    exec(improved_code, {"pd": pd, "np": np}, local_scope)
+                    exec(compile_source(improved_code, "<transformation>"), {"pd": pd, "np": np}, local_scope)
                     
                     # Get the result DataFrame
                     if "result_df" in local_scope:
@@ -357,6 +397,8 @@ class DataTransformationAgent:
                     traceback.print_exc()
                     raise ValueError(f"Failed to transform data: {str(retry_error)}")
             
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"Error processing transformation request: {str(e)}")
             traceback.print_exc()
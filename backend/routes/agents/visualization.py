@@ -1,12 +1,13 @@
 from typing import Dict, Any, List, Optional
-from openai import OpenAI
+from openai import AsyncOpenAI
 import os
 import json
 from fastapi import HTTPException
 import pandas as pd
 import numpy as np
 import traceback
-from together import Together
+from together import AsyncTogether
+from routes.agents.sandbox import compile_source
 
 import dotenv
 dotenv.load_dotenv()
@@ -20,14 +21,14 @@ class DataVizualizationAgent:
                 api_key = os.getenv("TOGETHER_API_KEY")
                 # export together api key to environment variable
                 os.environ["TOGETHER_API_KEY"] = api_key
-                self.client = Together()
+                self.client = AsyncTogether()
                 self.model = "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8"
             except Exception as e:
                 print(f"Error loading Together API: {str(e)}")
                 raise HTTPException(status_code=500, detail="Failed to load Together API.")
         else:
             try:
-                self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+                self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
                 self.model = "gpt-4o"
             except Exception as e:
                 print(f"Error loading OpenAI API: {str(e)}")
@@ -56,40 +57,37 @@ class DataVizualizationAgent:
     
     def _convert_to_chart_format(self, df: pd.DataFrame, x_column: str, y_columns: List[str]) -> List[Dict[str, Any]]:
         """Convert a DataFrame to the chart format required by the frontend."""
-        if df.empty:
+        if df.empty or x_column not in df.columns:
             return []
         
-        # Replace NaN, Infinity, -Infinity with None (which becomes null in JSON)
-        # to avoid JSON serialization issues
-        df_clean = df.copy()
+        # Skip rows with empty or None x_column values
+        x_values = df[x_column]
+        names = x_values.astype(str).str.strip()
+        keep = (x_values.notna() & (names != '')).to_numpy()
+        names = names[keep].tolist()
         
-        # Handle numeric columns that might have special values
-        for col in df_clean.select_dtypes(include=['float', 'int']).columns:
-            # Replace inf/-inf with NaN
-            df_clean[col] = df_clean[col].replace([float('inf'), float('-inf')], np.nan)
-            # Replace NaN with None using mask
-            df_clean[col] = df_clean[col].mask(pd.isna(df_clean[col]), None)
+        # Coerce each y column once. Finite numbers become floats, other non-null
+        # values that don't parse are passed through unchanged, and NaN/Infinity
+        # are left out so the JSON stays valid.
+        y_data = []
+        for col in y_columns:
+            if col not in df.columns:
+                continue
+            raw = df[col][keep]
+            numeric = pd.to_numeric(raw, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            finite = np.isfinite(numeric)
+            passthrough = np.isnan(numeric) & raw.notna().to_numpy()
+            values = numeric.astype(object)
+            values[passthrough] = raw.to_numpy(dtype=object)[passthrough]
+            y_data.append((col, values.tolist(), (finite | passthrough).tolist()))
         
         # Convert to chart format
         result = []
-        for _, row in df_clean.iterrows():
-            # Skip rows with empty or None x_column values
-            if pd.isna(row.get(x_column)) or str(row.get(x_column)).strip() == '':
-                continue
-                
-            # Use str() to ensure name is always a string
-            data_point = {'name': str(row[x_column]).strip()}
-            for col in y_columns:
-                if col in df_clean.columns:
-                    value = row.get(col)
-                    # Skip None or NaN values
-                    if value is not None and not (isinstance(value, float) and (pd.isna(value) or np.isinf(value))):
-                        # Ensure numeric values are floats for consistency
-                        try:
-                            data_point[col] = float(value)
-                        except (ValueError, TypeError):
-                            # If conversion fails, use original value
-                            data_point[col] = value
+        for i, name in enumerate(names):
+            data_point = {'name': name}
+            for col, values, present in y_data:
+                if present[i]:
+                    data_point[col] = values[i]
             
             # Only add the data point if it has at least one y-value
             if len(data_point) > 1:  # More than just the 'name' field
@@ -109,7 +107,8 @@ class DataVizualizationAgent:
                 for sheet_id, data in request.relevantData.items():
                     data_summary[sheet_id] = {
                         "rows": len(data) if isinstance(data, list) else "not an array",
-                        "totalCharacters": len(json.dumps(data)),
+                        # Estimated from one row rather than serializing the whole sheet
+                        "approxCharacters": len(json.dumps(data[-1])) * len(data) if isinstance(data, list) and data else 0,
                         "sample": json.dumps(data[:2])[:200] + "..." if isinstance(data, list) and data else "no data"
                     }
             
@@ -120,6 +119,10 @@ class DataVizualizationAgent:
             source_data = request.relevantData.get(primary_sheet_id, [])
             primary_sheet_name = request.sheets.get(primary_sheet_id, {}).get('name', primary_sheet_id)
             
+            # Nothing to work on: skip DataFrame construction altogether
+            if not source_data:
+                raise ValueError("Could not create DataFrame from the provided data")
+            
             # Convert data to pandas DataFrame
             df = self._create_dataframe_from_raw(source_data)
             if df.empty:
@@ -205,7 +208,7 @@ class DataVizualizationAgent:
             """
             
             # Get OpenAI analysis
-            analysis_response = self.client.chat.completions.create(
+            analysis_response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a data visualization API. Return only valid JSON with no comments, no markdown, and no explanation."},
@@ -236,7 +239,7 @@ class DataVizualizationAgent:
                 local_scope = {"df": df, "pd": pd, "np": np}
                 
                 # Execute the transformation code
-                exec(data_transformation_code, {"pd": pd, "np": np}, local_scope)
+                exec(compile_source(data_transformation_code, "<visualization>"), {"pd": pd, "np": np}, local_scope)
                 
                 # Get the result DataFrame
                 if "result_df" in local_scope:
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
-from typing import Dict, List, Optional, Any
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional, Any, AsyncIterator
 from pydantic import BaseModel
 from openai import OpenAI
 import json
+import orjson
 import os
+import asyncio
 from routes.auth import get_current_user
 from models.record import Record
 from routes.agents.classifier import RequestClassifier
@@ -24,6 +28,9 @@ class AnalysisRequest(BaseModel):
     activeSheetId: Optional[str] = None
     explicitTargetSheetId: Optional[str] = None
 
+# How often a running /analyze2 request checks whether its client is still connected
+_DISCONNECT_POLL_SECONDS = 0.5
+
 # Initialize agents
 request_classifier = RequestClassifier()
 data_visualization_agent = DataVizualizationAgent()
@@ -31,9 +38,86 @@ data_transformation_agent = DataTransformationAgent()
 statistical_agent = StatisticalAgent()  # Initialize the StatisticalAgent
 query_bot = QueryBot()
 
+async def _dispatch(request_type: str, request: AnalysisRequest, current_user: User, on_token=None):
+    """Run the agent for a classified request; on_token only applies to statistical interpretations."""
+    if request_type == "visualization":
+        return await data_visualization_agent.analyze(request, current_user)
+    elif request_type == "transformation":
+        return await data_transformation_agent.analyze(request, current_user)
+    elif request_type == "statistical":  # Add statistical support
+        return await statistical_agent.analyze(request, current_user, on_token=on_token)
+    elif request_type == "query":
+        return await query_bot.analyze(request, current_user)
+    else:
+        # Default to query for any unhandled request types
+        print(f"Unhandled request type: {request_type}. Defaulting to query.")
+        return await query_bot.analyze(request, current_user)
+
+async def _until_disconnected(http_request: Request, coro):
+    """Await coro, cancelling it (and any completion it is waiting on) if the client disconnects first."""
+    task = asyncio.create_task(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=_DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                print("Client disconnected; abandoning analysis request")
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+def _ndjson_line(payload: Dict[str, Any]) -> str:
+    return orjson.dumps(jsonable_encoder(payload), option=orjson.OPT_APPEND_NEWLINE).decode()
+
+async def _stream_analysis(request: AnalysisRequest, current_user: User) -> AsyncIterator[str]:
+    """
+    Yield NDJSON events for one request: "delta" lines carrying interpretation
+    text as it is generated, then a single "result" (or "error") line with the
+    same payload /analyze2 returns.
+    """
+    tokens: asyncio.Queue = asyncio.Queue()
+    task = None
+    try:
+        request_type = await request_classifier.classify(request)
+        task = asyncio.create_task(_dispatch(request_type, request, current_user, on_token=tokens.put))
+        
+        # Forward tokens until the agent finishes, then flush whatever is left
+        while True:
+            next_token = asyncio.ensure_future(tokens.get())
+            done, _ = await asyncio.wait({next_token, task}, return_when=asyncio.FIRST_COMPLETED)
+            if next_token in done:
+                yield _ndjson_line({"type": "delta", "text": next_token.result()})
+                continue
+            next_token.cancel()
+            break
+        while not tokens.empty():
+            yield _ndjson_line({"type": "delta", "text": tokens.get_nowait()})
+        
+        yield _ndjson_line({"type": "result", **task.result()})
+    except HTTPException as e:
+        print(f"Error in analyze stream: {str(e.detail)}")
+        yield _ndjson_line({"type": "error", "status": e.status_code, "detail": e.detail})
+    except Exception as e:
+        print(f"Error in analyze stream: {str(e)}")
+        yield _ndjson_line({
+            "type": "error",
+            "status": 500,
+            "detail": {
+                "error": "Failed to process request",
+                "text": "An error occurred while processing your request. Please try again."
+            }
+        })
+    finally:
+        # The client went away mid-stream: don't leave the agent running
+        if task is not None and not task.done():
+            task.cancel()
+
 @router.post("/analyze2")
 async def analyze(
     request: AnalysisRequest,
+    http_request: Request,
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -43,20 +127,14 @@ async def analyze(
         # Classify the request
         request_type = await request_classifier.classify(request)
         
-        # Route to appropriate handler based on request type
-        if request_type == "visualization":
-            return await data_visualization_agent.analyze(request, current_user)
-        elif request_type == "transformation":
-            return await data_transformation_agent.analyze(request, current_user)
-        elif request_type == "statistical":  # Add statistical support
-            return await statistical_agent.analyze(request, current_user)
-        elif request_type == "query":
-            return await query_bot.analyze(request, current_user)
-        else:
-            # Default to query for any unhandled request types
-            print(f"Unhandled request type: {request_type}. Defaulting to query.")
-            return await query_bot.analyze(request, current_user)
+        # Route to appropriate handler based on request type, stopping early
+        # (and skipping any further completions) if the client has gone
+        return await _until_disconnected(http_request, _dispatch(request_type, request, current_user))
     except Exception as e:
+        # Client errors (a bad column name, or 499 for a disconnected client)
+        # already carry the detail to send, or need none
+        if isinstance(e, HTTPException) and e.status_code < 500:
+            raise
         print(f"Error in analyze route: {str(e)}")
         raise HTTPException(
             status_code=500,
@@ -64,4 +142,16 @@ async def analyze(
                 "error": "Failed to process request",
                 "text": "An error occurred while processing your request. Please try again."
             }
-        )
\ No newline at end of file
+        )
+
+@router.post("/analyze2/stream")
+async def analyze_stream(
+    request: AnalysisRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Streaming variant of /analyze2. Responds with newline-delimited JSON so
+    statistical interpretations show up token by token; other request types
+    produce just the final "result" line.
+    """
+    return StreamingResponse(_stream_analysis(request, current_user), media_type="application/x-ndjson")
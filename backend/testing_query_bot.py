@@ -0,0 +1,44 @@
+import pandas as pd
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Import the agent
+from routes.agents.query_bot import QueryBot
+
+def test_trailing_blank_row_keeps_numeric_dtypes():
+    """A sheet ending in an empty row must still give numeric columns numeric dtypes."""
+    bot = QueryBot()
+
+    data = [
+        ["Region", "Sales", "Units"],
+        ["North", 3000.5, 120],
+        ["East", 2375.0, 95],
+        ["South", 2145.25, 143],
+        ["", "", ""],
+        [None, None, None]
+    ]
+
+    df = bot._create_dataframe_from_raw(data)
+    print(f"Array format dtypes:\n{df.dtypes}")
+    assert len(df) == 3
+    assert pd.api.types.is_float_dtype(df["Sales"])
+    assert pd.api.types.is_integer_dtype(df["Units"])
+
+    records = [
+        {"Region": "North", "Sales": 3000.5, "Units": 120},
+        {"Region": "East", "Sales": 2375.0, "Units": 95},
+        {"Region": None, "Sales": "", "Units": None}
+    ]
+
+    df = bot._create_dataframe_from_raw(records)
+    print(f"Object format dtypes:\n{df.dtypes}")
+    assert len(df) == 2
+    assert pd.api.types.is_float_dtype(df["Sales"])
+    assert pd.api.types.is_integer_dtype(df["Units"])
+
+    print("\nAll checks passed")
+
+if __name__ == "__main__":
+    test_trailing_blank_row_keeps_numeric_dtypes()